@@ -2,9 +2,10 @@
 
 
 from flask import Flask, request, jsonify, Response
-from flask import send_file
+from flask import send_file, g, has_request_context
 from flask_cors import CORS
 import os
+import sys
 import json
 import jwt
 import datetime
@@ -13,12 +14,68 @@ from flask_pymongo import PyMongo
 from functools import wraps
 from bson import ObjectId
 import cv2
+import numpy as np
 import math
 import io
+import threading
+import time
+import hashlib
+import bisect
+import tempfile
+import struct
+import zlib
+import mimetypes
+import shutil
+import tarfile
+import uuid
+import zipfile
+from collections import OrderedDict
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager, nullcontext
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import DuplicateKeyError
+
+import decode_worker
+
+# Set under gunicorn's gevent worker (SERVER_MODE=async, see gunicorn.conf.py). Socket I/O,
+# Mongo included, then yields to other requests; CPU-bound OpenCV work does not, so it goes
+# to the decode process pool and long decode loops yield between frames.
+_ASYNC_MODE = ('gevent.monkey' in sys.modules
+               and sys.modules['gevent.monkey'].is_module_patched('socket'))
 
 app = Flask(__name__)
 CORS(app)
 
+# Instrumentation (see the Instrumentation section): /metrics in Prometheus text format
+# and Server-Timing response headers. Both off by default.
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '0') in ('1', 'true', 'True')
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', '')
+app.config['METRICS_FLUSH_INTERVAL'] = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+app.config['SERVER_TIMING'] = os.environ.get('SERVER_TIMING', '0') in ('1', 'true', 'True')
+_INSTRUMENTED = app.config['METRICS_ENABLED'] or app.config['SERVER_TIMING']
+
+
+class _MongoTimingListener(monitoring.CommandListener):
+    """Feeds pymongo's command round-trip times into the instrumentation."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        _observe_mongo(event.command_name, event.duration_micros, failed=False)
+
+    def failed(self, event):
+        _observe_mongo(event.command_name, event.duration_micros, failed=True)
+
+
+if _INSTRUMENTED:
+    # listeners only reach clients created after registration
+    monitoring.register(_MongoTimingListener())
+
 # Configure MongoDB connection via env var for containerization
 app.config['MONGO_URI'] = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/labelmv')
 mongo = PyMongo(app)
@@ -26,21 +83,401 @@ mongo = PyMongo(app)
 # Secret key for JWT via env var
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'changeme-in-prod')
 
+# Per-worker pool of open VideoCapture handles (see _CapturePool)
+app.config['CAPTURE_POOL_SIZE'] = int(os.environ.get('CAPTURE_POOL_SIZE', '8'))
+app.config['CAPTURE_IDLE_TIMEOUT'] = float(os.environ.get('CAPTURE_IDLE_TIMEOUT', '300'))
+# Largest forward gap (in raw frames) we read through instead of seeking
+app.config['CAPTURE_MAX_FORWARD_GRAB'] = int(os.environ.get('CAPTURE_MAX_FORWARD_GRAB', '120'))
+# Record keyframe positions when probing a video into the metadata index
+app.config['VIDEO_META_KEYFRAMES'] = os.environ.get('VIDEO_META_KEYFRAMES', '1') not in ('0', 'false', 'False')
+# /videos only lists at or below this directory
+app.config['VIDEO_ROOT'] = os.environ.get('VIDEO_ROOT', '/app/videos')
+# /videos listing: seconds a directory listing is reused before mtimes are rechecked,
+# directories kept in the scan cache, metadata probe threads and the largest page size
+app.config['VIDEO_INDEX_RECHECK'] = float(os.environ.get('VIDEO_INDEX_RECHECK', '2'))
+app.config['VIDEO_INDEX_MAX_DIRS'] = int(os.environ.get('VIDEO_INDEX_MAX_DIRS', '10000'))
+app.config['VIDEO_PROBE_WORKERS'] = int(os.environ.get('VIDEO_PROBE_WORKERS', '4'))
+app.config['VIDEO_LIST_MAX_PAGE'] = int(os.environ.get('VIDEO_LIST_MAX_PAGE', '500'))
+# Encoded frame cache: in-process LRU per worker, plus an optional on-disk tier shared by all workers
+app.config['FRAME_CACHE_MAX_BYTES'] = int(os.environ.get('FRAME_CACHE_MAX_BYTES', str(128 * 1024 * 1024)))
+app.config['FRAME_CACHE_DIR'] = os.environ.get('FRAME_CACHE_DIR', '')
+app.config['FRAME_CACHE_DISK_MAX_BYTES'] = int(os.environ.get('FRAME_CACHE_DISK_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+# Pre-extracted sampled frames (see /api/projects/<id>/extract)
+app.config['FRAME_STORE_DIR'] = os.environ.get(
+    'FRAME_STORE_DIR', os.path.join(tempfile.gettempdir(), 'labelmv-frames'))
+# Extraction, proxy and sprite builds share one pool per worker, sized so that all
+# gunicorn workers together stay within the host's CPUs; keyframe scans get their own
+app.config['EXTRACT_WORKERS'] = int(os.environ.get(
+    'EXTRACT_WORKERS', str(max(1, (os.cpu_count() or 1) // max(1, int(os.environ.get('WEB_CONCURRENCY', '1')))))))
+app.config['KEYFRAME_SCAN_WORKERS'] = int(os.environ.get('KEYFRAME_SCAN_WORKERS', '1'))
+# Browser-playable proxy renditions for /video?proxy=1
+app.config['PROXY_DIR'] = os.environ.get(
+    'PROXY_DIR', os.path.join(tempfile.gettempdir(), 'labelmv-proxies'))
+app.config['PROXY_HEIGHT'] = int(os.environ.get('PROXY_HEIGHT', '480'))
+app.config['VIDEO_MAX_AGE'] = int(os.environ.get('VIDEO_MAX_AGE', '3600'))
+# Timeline thumbnail sprites: tile width in px and tiles per sheet (columns x rows)
+app.config['SPRITE_DIR'] = os.environ.get(
+    'SPRITE_DIR', os.path.join(tempfile.gettempdir(), 'labelmv-sprites'))
+app.config['SPRITE_TILE_WIDTH'] = int(os.environ.get('SPRITE_TILE_WIDTH', '160'))
+app.config['SPRITE_COLUMNS'] = int(os.environ.get('SPRITE_COLUMNS', '10'))
+app.config['SPRITE_ROWS'] = int(os.environ.get('SPRITE_ROWS', '10'))
+# Training-dataset export (see /api/projects/<id>/dataset): one video per decode process
+app.config['DATASET_EXPORT_DIR'] = os.environ.get(
+    'DATASET_EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'labelmv-datasets'))
+app.config['DATASET_EXPORT_WORKERS'] = int(os.environ.get('DATASET_EXPORT_WORKERS', str(os.cpu_count() or 1)))
+# Decode process pool with admission control (0 = decode inline in the API worker)
+app.config['DECODE_POOL_WORKERS'] = int(os.environ.get('DECODE_POOL_WORKERS', '2' if _ASYNC_MODE else '0'))
+app.config['DECODE_MAX_QUEUE'] = int(os.environ.get('DECODE_MAX_QUEUE', '16'))
+app.config['DECODE_MAX_PER_USER'] = int(os.environ.get('DECODE_MAX_PER_USER', '4'))
+app.config['DECODE_DEADLINE'] = float(os.environ.get('DECODE_DEADLINE', '5'))
+# Batch /frames endpoint: decode threads per worker and max frames per request
+app.config['BATCH_DECODE_WORKERS'] = int(os.environ.get('BATCH_DECODE_WORKERS', str(min(8, os.cpu_count() or 1))))
+app.config['BATCH_MAX_FRAMES'] = int(os.environ.get('BATCH_MAX_FRAMES', '64'))
+# Server-side prefetch around the sample just served by /frame (override per request with ?prefetch=k)
+app.config['FRAME_PREFETCH_AHEAD'] = int(os.environ.get('FRAME_PREFETCH_AHEAD', '3'))
+app.config['FRAME_PREFETCH_BEHIND'] = int(os.environ.get('FRAME_PREFETCH_BEHIND', '1'))
+app.config['FRAME_PREFETCH_WORKERS'] = int(os.environ.get('FRAME_PREFETCH_WORKERS', '2'))
+app.config['FRAME_PREFETCH_PER_USER'] = int(os.environ.get('FRAME_PREFETCH_PER_USER', '8'))
+app.config['FRAME_PREFETCH_MAX'] = int(os.environ.get('FRAME_PREFETCH_MAX', '32'))
+
+# Annotation docs per bulk_write/insert_many call when importing
+app.config['IMPORT_CHUNK_SIZE'] = int(os.environ.get('IMPORT_CHUNK_SIZE', '1000'))
+
+# /annotations/changes: page size cap and how long recent writes are held back
+app.config['CHANGE_FEED_LIMIT'] = int(os.environ.get('CHANGE_FEED_LIMIT', '1000'))
+app.config['CHANGE_FEED_SETTLE'] = float(os.environ.get('CHANGE_FEED_SETTLE', '1'))
+
+# Largest sample span one propagate/interpolate request may write
+app.config['PROPAGATE_MAX_SAMPLES'] = int(os.environ.get('PROPAGATE_MAX_SAMPLES', '10000'))
+
+# Cursor batch size for streamed exports
+app.config['EXPORT_BATCH_SIZE'] = int(os.environ.get('EXPORT_BATCH_SIZE', '500'))
+
+# Short-lived per-worker caches for token -> user and project_id -> project lookups
+app.config['AUTH_CACHE_TTL'] = float(os.environ.get('AUTH_CACHE_TTL', '60'))
+app.config['PROJECT_CACHE_TTL'] = float(os.environ.get('PROJECT_CACHE_TTL', '10'))
+app.config['LOOKUP_CACHE_SIZE'] = int(os.environ.get('LOOKUP_CACHE_SIZE', '4096'))
+# Per-view /stats results; writes through this worker drop the affected view at once
+app.config['STATS_CACHE_TTL'] = float(os.environ.get('STATS_CACHE_TTL', '30'))
+
+# Create collection indexes at startup (idempotent; disable with ENSURE_INDEXES=0)
+app.config['ENSURE_INDEXES'] = os.environ.get('ENSURE_INDEXES', '1') not in ('0', 'false', 'False')
+
 # In-memory storage for annotations (for simplicity, will be replaced with database)
 annotations_storage = {}
 
-@app.route('/videos', methods=['GET'])
-def get_videos():
-    directory = request.args.get('directory') or '/app/videos'
-    if not os.path.isdir(directory):
-        return jsonify({"error": "Invalid directory path"}), 400
+# Fields the project routes actually read; keeps list/lookups from dragging whole docs around
+_PROJECT_LIST_FIELDS = {
+    'video_directory': 1, 'selected_videos': 1, 'fps': 1, 'classes': 1,
+    'attributes': 1, 'created_at': 1, 'updated_at': 1,
+}
+
+# (collection, keys, options) for every index the queries below rely on
+_INDEXES = [
+    # every per-frame read/write; unique so concurrent upserts cannot create twins
+    ('annotations', [('user_id', ASCENDING), ('project_id', ASCENDING),
+                     ('video_index', ASCENDING), ('sample_index', ASCENDING)],
+     {'name': 'frame_key', 'unique': True}),
+    # track timelines and ID renames: the frames that contain a given box objectId
+    ('annotations', [('user_id', ASCENDING), ('project_id', ASCENDING), ('boxes.objectId', ASCENDING),
+                     ('video_index', ASCENDING), ('sample_index', ASCENDING)],
+     {'name': 'track_key'}),
+    # /annotations/changes: a project's frames in write order
+    ('annotations', [('user_id', ASCENDING), ('project_id', ASCENDING), ('updated_at', ASCENDING),
+                     ('video_index', ASCENDING), ('sample_index', ASCENDING)],
+     {'name': 'changes'}),
+    # list_projects: filter by owner, newest first
+    ('projects', [('user_id', ASCENDING), ('updated_at', DESCENDING)],
+     {'name': 'owner_updated'}),
+    # signin/signup
+    ('users', [('username', ASCENDING)], {'name': 'username', 'unique': True}),
+    ('extract_jobs', [('project_id', ASCENDING), ('video_index', ASCENDING)],
+     {'name': 'project_video'}),
+    ('dataset_exports', [('project_id', ASCENDING)], {'name': 'project'}),
+    # progress docs are only interesting for a while after the download
+    ('dataset_exports', [('updated_at', ASCENDING)],
+     {'name': 'expire', 'expireAfterSeconds': 7 * 24 * 3600}),
+]
+
+
+def _ensure_indexes():
+    """Create missing indexes. Safe to run from every worker; existing ones are a no-op."""
+    for coll, keys, opts in _INDEXES:
+        try:
+            name = mongo.db[coll].create_index(keys, **opts)
+            app.logger.info('index ensured: %s.%s', coll, name)
+        except Exception as e:
+            # e.g. pre-existing duplicate annotation docs block the unique index
+            app.logger.error('could not create index %s on %s: %s', opts.get('name'), coll, e)
+
+
+if app.config['ENSURE_INDEXES']:
+    # off the import path so a slow or unreachable Mongo does not stall worker boot
+    threading.Thread(target=_ensure_indexes, name='ensure-indexes', daemon=True).start()
+
+
+# -------- Instrumentation --------
+#
+# Per-worker counters and histograms, served by /metrics in Prometheus text format
+# (METRICS_ENABLED) and summarized per request in a Server-Timing header
+# (SERVER_TIMING). With both off no hook or listener is installed and _stage()
+# returns a shared no-op context manager.
+
+_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_METRIC_HELP = {
+    'labelmv_http_request_duration_seconds': ('histogram', 'Time to build a response, by route.'),
+    'labelmv_stage_duration_seconds': ('histogram', 'Time spent in one stage of request handling.'),
+    'labelmv_mongo_command_duration_seconds': ('histogram', 'Mongo command round trips.'),
+    'labelmv_mongo_command_failures_total': ('counter', 'Mongo commands that failed.'),
+    'labelmv_cache_events_total': ('counter', 'Cache lookups and evictions by outcome.'),
+    'labelmv_cache_hit_ratio': ('gauge', 'Hits over lookups since the worker started.'),
+    'labelmv_requests_in_flight': ('gauge', 'Requests being handled.'),
+    'labelmv_decode_in_flight': ('gauge', 'Frame decodes admitted to the decode pool.'),
+    'labelmv_prefetch_in_flight': ('gauge', 'Prefetch jobs queued or running.'),
+    'labelmv_open_captures': ('gauge', 'VideoCapture handles held by the capture pool.'),
+}
+
+
+class _Metrics:
+    """This worker's counters and histograms. Labels are tuples of (name, value) pairs."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._counters = {}
+        # per key: one count per bucket, one for +Inf, then the sum
+        self._histograms = {}
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_in_flight(self, delta):
+        with self._lock:
+            self.in_flight += delta
+
+    def observe(self, name, labels, seconds):
+        key = (name, labels)
+        slot = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            h[slot] += 1
+            h[-1] += seconds
+
+    def snapshot(self):
+        """JSON-able copy of everything, live cache counters and gauges included."""
+        with self._lock:
+            counters = [[n, [list(l) for l in labels], v] for (n, labels), v in self._counters.items()]
+            histograms = [[n, [list(l) for l in labels], h[:-1], h[-1]]
+                          for (n, labels), h in self._histograms.items()]
+            in_flight = self.in_flight
+        live_counters, gauges = _live_series()
+        gauges.append(['labelmv_requests_in_flight', [], in_flight])
+        return {'buckets': list(self.buckets), 'counters': counters + live_counters,
+                'gauges': gauges, 'histograms': histograms}
+
+
+_metrics = _Metrics(_LATENCY_BUCKETS)
+_NO_STAGE = nullcontext()
+
+
+def _add_server_timing(name, seconds):
+    if has_request_context():
+        stages = g.get('timing_stages')
+        if stages is not None:
+            stages[name] = stages.get(name, 0.0) + seconds
+
+
+def _record_stage(name, seconds):
+    if app.config['METRICS_ENABLED']:
+        _metrics.observe('labelmv_stage_duration_seconds', (('stage', name),), seconds)
+    _add_server_timing(name, seconds)
+
+
+@contextmanager
+def _timed_stage(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_stage(name, time.perf_counter() - t0)
+
+
+def _stage(name):
+    """Time a block as stage `name` of the current request; a no-op when instrumentation is off."""
+    if not _INSTRUMENTED:
+        return _NO_STAGE
+    return _timed_stage(name)
+
+
+def _observe_mongo(command, duration_micros, failed):
+    seconds = duration_micros / 1e6
+    if app.config['METRICS_ENABLED']:
+        labels = (('command', command),)
+        _metrics.observe('labelmv_mongo_command_duration_seconds', labels, seconds)
+        if failed:
+            _metrics.inc('labelmv_mongo_command_failures_total', labels)
+    # overlaps the auth/project/video_meta stages that issued the command
+    _add_server_timing('db', seconds)
+
+
+def _live_series():
+    """Counters and gauges read from the caches and pools at scrape time."""
+    counters, gauges = [], []
+
+    def cache(name, hits, misses, extra=()):
+        for event, value in (('hit', hits), ('miss', misses)) + tuple(extra):
+            counters.append(['labelmv_cache_events_total', [['cache', name], ['event', event]], value])
+        if hits + misses:
+            gauges.append(['labelmv_cache_hit_ratio', [['cache', name]], hits / float(hits + misses)])
+
+    fc = frame_cache.stats()
+    cache('frame', fc['memory_hits'] + fc['disk_hits'], fc['misses'],
+          (('disk_hit', fc['disk_hits']), ('eviction', fc['evictions'])))
+    cache('user', _user_cache.hits, _user_cache.misses)
+    cache('project', _project_cache.hits, _project_cache.misses)
+
+    gauges.append(['labelmv_decode_in_flight', [], decode_pool.in_flight()])
+    gauges.append(['labelmv_prefetch_in_flight', [], prefetcher.in_flight()])
+    gauges.append(['labelmv_open_captures', [], capture_pool.size()])
+    return counters, gauges
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _render_prometheus(snapshots):
+    """Prometheus text exposition of [(worker, snapshot)]; every series carries a worker label."""
+    series = OrderedDict()
+    for worker, snap in snapshots:
+        wl = [['worker', worker]]
+        for name, labels, value in snap['counters'] + snap['gauges']:
+            series.setdefault(name, []).append(
+                f'{name}{_format_labels(labels + wl)} {_format_value(value)}')
+        bounds = [repr(float(b)) for b in snap['buckets']] + ['+Inf']
+        for name, labels, counts, total in snap['histograms']:
+            lines = series.setdefault(name, [])
+            cumulative = 0
+            for le, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels + wl + [["le", le]])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels + wl)} {_format_value(float(total))}')
+            lines.append(f'{name}_count{_format_labels(labels + wl)} {cumulative}')
+
+    out = []
+    for name in sorted(series):
+        kind, text = _METRIC_HELP.get(name, ('untyped', name))
+        out.append(f'# HELP {name} {text}')
+        out.append(f'# TYPE {name} {kind}')
+        out.extend(series[name])
+    return '\n'.join(out) + '\n'
+
+
+def _other_worker_snapshots():
+    """Snapshots other workers left in METRICS_DIR; files not refreshed lately are removed."""
+    directory = app.config['METRICS_DIR']
+    if not directory:
+        return []
+    own = f'{os.getpid()}.json'
+    max_age = max(60.0, 10 * app.config['METRICS_FLUSH_INTERVAL'])
+    now = time.time()
+    out = []
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    for name in names:
+        if not name.endswith('.json') or name == own:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if now - os.stat(path).st_mtime > max_age:
+                # the worker is gone
+                os.remove(path)
+                continue
+            with open(path, 'rb') as fh:
+                out.append((name[:-5], json.loads(fh.read())))
+        except (OSError, ValueError):
+            continue
+    return out
+
+
+def _flush_metrics_forever():
+    directory = app.config['METRICS_DIR']
+    os.makedirs(directory, exist_ok=True)
+    while True:
+        time.sleep(app.config['METRICS_FLUSH_INTERVAL'])
+        try:
+            _write_atomic(os.path.join(directory, f'{os.getpid()}.json'),
+                          json.dumps(_metrics.snapshot()).encode())
+        except Exception as e:
+            app.logger.warning('could not write metrics snapshot: %s', e)
+
+
+def _start_request_timing():
+    g.timing_start = time.perf_counter()
+    g.timing_stages = {}
+    _metrics.add_in_flight(1)
+
+
+def _finish_request_timing(response):
+    start = g.get('timing_start')
+    if start is None:
+        return response
+    # streamed bodies are still being sent after this point
+    elapsed = time.perf_counter() - start
+    if app.config['METRICS_ENABLED']:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        labels = (('route', route), ('method', request.method), ('status', str(response.status_code)))
+        _metrics.observe('labelmv_http_request_duration_seconds', labels, elapsed)
+    if app.config['SERVER_TIMING']:
+        parts = [f'{name};dur={total * 1000:.2f}' for name, total in g.timing_stages.items()]
+        parts.append(f'total;dur={elapsed * 1000:.2f}')
+        response.headers.add('Server-Timing', ', '.join(parts))
+    return response
+
+
+def _end_request_timing(exc):
+    if g.get('timing_start') is not None:
+        _metrics.add_in_flight(-1)
+
+
+if _INSTRUMENTED:
+    app.before_request(_start_request_timing)
+    app.after_request(_finish_request_timing)
+    app.teardown_request(_end_request_timing)
+if app.config['METRICS_ENABLED'] and app.config['METRICS_DIR']:
+    threading.Thread(target=_flush_metrics_forever, name='metrics-flush', daemon=True).start()
 
-    video_files = []
-    for file in os.listdir(directory):
-        if file.endswith(('.mp4', '.avi', '.mov', '.mkv')):
-            video_files.append(file)
 
-    return jsonify(video_files)
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text exposition of this worker's metrics, plus other workers' via METRICS_DIR."""
+    if not app.config['METRICS_ENABLED']:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    expected = app.config['METRICS_TOKEN']
+    if expected and request.headers.get('Authorization') != 'Bearer ' + expected:
+        return jsonify({"error": "Unauthorized"}), 403
+    snapshots = [(str(os.getpid()), _metrics.snapshot())] + _other_worker_snapshots()
+    return Response(_render_prometheus(snapshots), mimetype='text/plain; version=0.0.4')
+
 
 # User registration endpoint
 @app.route('/api/auth/signup', methods=['POST'])
@@ -54,16 +491,20 @@ def signup():
         return jsonify({"error": "Username and password are required"}), 400
 
     # Check if user already exists
-    existing_user = mongo.db.users.find_one({"username": username})
+    existing_user = mongo.db.users.find_one({"username": username}, {"_id": 1})
     if existing_user:
         return jsonify({"error": "User already exists"}), 400
 
     # Hash the password and store user in database
     hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
-    mongo.db.users.insert_one({
-        "username": username,
-        "password": hashed_password
-    })
+    try:
+        mongo.db.users.insert_one({
+            "username": username,
+            "password": hashed_password
+        })
+    except DuplicateKeyError:
+        # lost a race with a concurrent signup for the same name
+        return jsonify({"error": "User already exists"}), 400
 
     return jsonify({"message": "User registered successfully"}), 201
 
@@ -79,7 +520,7 @@ def signin():
         return jsonify({"error": "Username and password are required"}), 400
 
     # Find user in database
-    user = mongo.db.users.find_one({"username": username})
+    user = mongo.db.users.find_one({"username": username}, {"password": 1})
 
     if not user or not check_password_hash(user['password'], password):
         return jsonify({"error": "Invalid credentials"}), 401
@@ -94,6 +535,90 @@ def signin():
         token = token.decode('utf-8')
     return jsonify({"token": token})
 
+class _TTLCache:
+    """Small thread-safe LRU whose entries also expire after `ttl` seconds.
+
+    Each gunicorn worker has its own copy, so invalidation only reaches the worker
+    that made the change; the TTL bounds how stale the other workers can be.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, ttl=None):
+        if self.ttl <= 0:
+            return
+        ttl = self.ttl if ttl is None else min(self.ttl, ttl)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+_user_cache = _TTLCache(app.config['LOOKUP_CACHE_SIZE'], app.config['AUTH_CACHE_TTL'])
+_project_cache = _TTLCache(app.config['LOOKUP_CACHE_SIZE'], app.config['PROJECT_CACHE_TTL'])
+
+
+def _user_for_token(token):
+    """Decode a JWT and load its user, reusing a cached result until the TTL or token expiry."""
+    user = _user_cache.get(token)
+    if user is not None:
+        return user
+    data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+    user = mongo.db.users.find_one({"_id": ObjectId(data['user_id'])}, {"password": 0})
+    if user is not None:
+        ttl = data['exp'] - time.time() if 'exp' in data else None
+        _user_cache.put(token, user, ttl)
+    return user
+
+
+def _cached_project(project_id):
+    """Project doc by id (None if missing or malformed id). Callers must not mutate it."""
+    try:
+        oid = ObjectId(project_id)
+    except Exception:
+        return None
+    project = _project_cache.get(str(oid))
+    if project is not None:
+        return project
+    with _stage('project'):
+        project = mongo.db.projects.find_one({'_id': oid})
+    if project is not None:
+        _project_cache.put(str(oid), project)
+    return project
+
+
+def _invalidate_project(project_id):
+    _project_cache.invalidate(str(project_id))
+
+
 # Middleware to verify JWT token
 def token_required(f):
     @wraps(f)
@@ -107,8 +632,30 @@ def token_required(f):
             return jsonify({"error": "Token is missing"}), 403
 
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            current_user = mongo.db.users.find_one({"_id": ObjectId(data['user_id'])})
+            with _stage('auth'):
+                current_user = _user_for_token(token)
+        except Exception as e:
+            return jsonify({"error": "Token is invalid", "message": str(e)}), 403
+
+        return f(current_user, *args, **kwargs)
+
+    return decorated
+
+
+def media_token_required(f):
+    """token_required that also accepts ?access_token=, for <video src> URLs that cannot set headers."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.args.get('access_token')
+        if 'Authorization' in request.headers:
+            token = request.headers['Authorization'].split(" ")[1]
+
+        if not token:
+            return jsonify({"error": "Token is missing"}), 403
+
+        try:
+            with _stage('auth'):
+                current_user = _user_for_token(token)
         except Exception as e:
             return jsonify({"error": "Token is invalid", "message": str(e)}), 403
 
@@ -116,6 +663,188 @@ def token_required(f):
 
     return decorated
 
+# -------- Video directory index --------
+#
+# /videos only lists below VIDEO_ROOT and never leaves its filesystem, so a client
+# cannot make a worker walk / or /proc or probe arbitrary files.
+#
+# Listing a large NAS mount is the slow part of /videos, so each directory's scandir
+# result is cached with the directory's mtime. Adding, removing or renaming a file
+# bumps the mtime of its directory, and only those directories are rescanned. Files
+# rewritten in place keep their old size/mtime here until their directory changes;
+# the metadata probe itself always revalidates against the file.
+
+_VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+_VIDEO_SORT_KEYS = {
+    'name': lambda f: f[0].lower(),
+    'mtime': lambda f: f[2],
+    'size': lambda f: f[1],
+}
+
+
+class _DirectoryIndex:
+    """Per-worker LRU of {directory: (mtime, [(name, size, mtime)], [subdirs])}.
+
+    Symlinked subdirectories are followed, but each walk visits a (device, inode)
+    once, so links pointing back up the tree neither loop nor duplicate entries,
+    and never descends into another filesystem or (through a link) out of `root`.
+    """
+
+    def __init__(self, recheck_interval, max_dirs, max_listings=64):
+        self.recheck_interval = recheck_interval
+        self.max_dirs = max(1, int(max_dirs))
+        self.max_listings = max(1, int(max_listings))
+        self._dirs = OrderedDict()
+        self._listings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _scan_dir(self, path, st):
+        with self._lock:
+            cached = self._dirs.get(path)
+            if cached is not None and cached[0] == st.st_mtime:
+                self._dirs.move_to_end(path)
+                return cached
+        files, subdirs = [], []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            subdirs.append(entry.name)
+                        elif entry.name.endswith(_VIDEO_EXTENSIONS) and entry.is_file():
+                            est = entry.stat()
+                            files.append((entry.name, est.st_size, est.st_mtime))
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+        result = (st.st_mtime, files, subdirs)
+        with self._lock:
+            self._dirs[path] = result
+            self._dirs.move_to_end(path)
+            while len(self._dirs) > self.max_dirs:
+                self._dirs.popitem(last=False)
+        return result
+
+    def list(self, directory, root, recursive=False):
+        """[(relative name, size, mtime)] of the videos under `directory`, itself inside `root`."""
+        key = (directory, recursive)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._listings.get(key)
+            if cached is not None and now - cached[0] < self.recheck_interval:
+                self._listings.move_to_end(key)
+                return cached[1]
+
+        out = []
+        visited = set()
+        device = None
+        pending = ['']
+        while pending:
+            rel = pending.pop()
+            path = os.path.join(directory, rel) if rel else directory
+            try:
+                st = os.stat(path)
+                if rel and os.path.islink(path) and not _within(os.path.realpath(path), root):
+                    continue
+            except OSError:
+                continue
+            if device is None:
+                device = st.st_dev
+            if st.st_dev != device or (st.st_dev, st.st_ino) in visited:
+                continue
+            visited.add((st.st_dev, st.st_ino))
+            scanned = self._scan_dir(path, st)
+            if scanned is None:
+                continue
+            _, files, subdirs = scanned
+            out.extend((os.path.join(rel, name) if rel else name, size, mtime) for name, size, mtime in files)
+            if recursive:
+                pending.extend(os.path.join(rel, d) if rel else d for d in subdirs if not d.startswith('.'))
+        with self._lock:
+            self._listings[key] = (now, out)
+            self._listings.move_to_end(key)
+            while len(self._listings) > self.max_listings:
+                self._listings.popitem(last=False)
+        return out
+
+
+_directory_index = _DirectoryIndex(app.config['VIDEO_INDEX_RECHECK'], app.config['VIDEO_INDEX_MAX_DIRS'])
+_probe_executor = ThreadPoolExecutor(max_workers=max(1, app.config['VIDEO_PROBE_WORKERS']),
+                                     thread_name_prefix='video-probe')
+
+
+def _listing_meta(directory, name):
+    # header probe only: browsing an archive must not queue a full demux per file
+    meta = _video_meta(os.path.join(directory, name), scan_keyframes=False)
+    if meta is None:
+        return None
+    fps = meta.get('raw_fps') or 0.0
+    return {
+        'fps': fps,
+        'frameCount': meta.get('total_frames'),
+        'width': meta.get('width'),
+        'height': meta.get('height'),
+        'codec': meta.get('codec'),
+        'duration': round(meta['total_frames'] / fps, 3) if fps and meta.get('total_frames') else None,
+    }
+
+
+def _within(path, root):
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+@app.route('/videos', methods=['GET'])
+@token_required
+def get_videos(current_user):
+    """Video files in `directory` (VIDEO_ROOT by default, never outside it), as a plain array of names.
+
+    Any of page, per_page, q, sort, order or meta switches to a paged envelope:
+    {"items": [{"name", "size", "mtime", "meta"?}], "total", "page", "per_page"}.
+    `q` filters by case-insensitive substring, `sort` is name|mtime|size, and
+    `meta=1` probes the page's videos in parallel for fps, frame count, resolution,
+    codec and duration. `recursive=1` includes subdirectories (names are then
+    relative paths).
+    """
+    root = os.path.realpath(app.config['VIDEO_ROOT'])
+    directory = os.path.realpath(request.args.get('directory') or root)
+    if not _within(directory, root):
+        return jsonify({"error": "Directory is outside the video root"}), 403
+    if not os.path.isdir(directory):
+        return jsonify({"error": "Invalid directory path"}), 400
+    recursive = request.args.get('recursive') in ('1', 'true')
+
+    files = _directory_index.list(directory, root, recursive)
+    paged = any(k in request.args for k in ('page', 'per_page', 'q', 'sort', 'order', 'meta'))
+    if not paged:
+        return jsonify(sorted(f[0] for f in files))
+
+    q = (request.args.get('q') or '').lower()
+    if q:
+        files = [f for f in files if q in f[0].lower()]
+    sort = request.args.get('sort') or 'name'
+    if sort not in _VIDEO_SORT_KEYS:
+        return jsonify({"error": "sort must be name, mtime or size"}), 400
+    files = sorted(files, key=_VIDEO_SORT_KEYS[sort], reverse=request.args.get('order') == 'desc')
+
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 100, type=int)
+    if page < 1 or per_page < 1:
+        return jsonify({"error": "page and per_page must be positive"}), 400
+    per_page = min(per_page, app.config['VIDEO_LIST_MAX_PAGE'])
+    window = files[(page - 1) * per_page:page * per_page]
+
+    items = [{'name': name, 'size': size,
+              'mtime': datetime.datetime.utcfromtimestamp(mtime).isoformat() + 'Z'}
+             for name, size, mtime in window]
+    if request.args.get('meta') in ('1', 'true') and items:
+        with _stage('probe'):
+            metas = _probe_executor.map(lambda it: _listing_meta(directory, it['name']), items)
+            for item, meta in zip(items, metas):
+                item['meta'] = meta
+    return jsonify({'items': items, 'total': len(files), 'page': page, 'per_page': per_page})
+
+
 # API endpoint to save annotations for a specific video
 @app.route('/api/annotations/<int:video_id>', methods=['POST'])
 @token_required
@@ -186,12 +915,16 @@ def create_or_update_project(current_user):
         if not existing or existing.get('user_id') != str(current_user['_id']):
             return jsonify({"error": "Project not found or unauthorized"}), 404
         mongo.db.projects.update_one({'_id': ObjectId(project_id)}, {'$set': doc})
+        _invalidate_project(project_id)
         pid = ObjectId(project_id)
     else:
         doc['created_at'] = datetime.datetime.utcnow()
         res = mongo.db.projects.insert_one(doc)
         pid = res.inserted_id
 
+    # probe once here so /video_info and /frame never open the container just for metadata
+    _index_project_videos(video_directory, selected_videos)
+
     return jsonify({
         'projectId': str(pid),
         'videoDirectory': video_directory,
@@ -206,7 +939,7 @@ def create_or_update_project(current_user):
 def list_projects(current_user):
     """List all projects owned by the current user, newest first."""
     user_id = str(current_user['_id'])
-    cursor = mongo.db.projects.find({'user_id': user_id}).sort('updated_at', -1)
+    cursor = mongo.db.projects.find({'user_id': user_id}, _PROJECT_LIST_FIELDS).sort('updated_at', -1)
     items = []
     for p in cursor:
         items.append({
@@ -226,10 +959,7 @@ def list_projects(current_user):
 @token_required
 def get_project(current_user, project_id):
     """Return a single project the user owns, including attributes and classes."""
-    try:
-        project = mongo.db.projects.find_one({'_id': ObjectId(project_id)})
-    except Exception:
-        project = None
+    project = _cached_project(project_id)
     if not project or project.get('user_id') != str(current_user['_id']):
         return jsonify({"error": "Project not found or unauthorized"}), 404
 
@@ -249,10 +979,7 @@ def get_project(current_user, project_id):
 @token_required
 def delete_project(current_user, project_id):
     """Delete a project and all related annotations owned by the current user."""
-    try:
-        project = mongo.db.projects.find_one({'_id': ObjectId(project_id)})
-    except Exception:
-        project = None
+    project = _cached_project(project_id)
     if not project or project.get('user_id') != str(current_user['_id']):
         return jsonify({"error": "Project not found or unauthorized"}), 404
 
@@ -261,8 +988,11 @@ def delete_project(current_user, project_id):
         'user_id': str(current_user['_id']),
         'project_id': str(project['_id'])
     })
+    mongo.db.extract_jobs.delete_many({'project_id': str(project['_id'])})
+    mongo.db.dataset_exports.delete_many({'project_id': str(project['_id'])})
     # Delete the project
     proj_res = mongo.db.projects.delete_one({'_id': project['_id']})
+    _invalidate_project(project['_id'])
 
     return jsonify({
         'success': True,
@@ -273,14 +1003,36 @@ def delete_project(current_user, project_id):
     })
 
 
+def _export_annotation_item(doc):
+    return {
+        'video_index': int(doc.get('video_index', 0)),
+        'sample_index': int(doc.get('sample_index', 0)),
+        'boxes': doc.get('boxes') or [],
+        'updated_at': doc.get('updated_at').isoformat() if doc.get('updated_at') else None,
+        'created_at': doc.get('created_at').isoformat() if doc.get('created_at') else None,
+    }
+
+
+def _gzip_stream(chunks):
+    """Compress an iterable of byte chunks on the fly as one gzip member."""
+    comp = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = comp.compress(chunk)
+        if out:
+            yield out
+    yield comp.flush()
+
+
 @app.route('/api/projects/<project_id>/export', methods=['GET'])
 @token_required
 def export_project_annotations(current_user, project_id):
-    """Export project metadata and all annotations for this user/project as JSON."""
-    try:
-        project = mongo.db.projects.find_one({'_id': ObjectId(project_id)})
-    except Exception:
-        project = None
+    """Export project metadata and all annotations for this user/project as JSON.
+
+    ?stream=1 streams the same document straight from the Mongo cursor instead of
+    building it in memory; ?format=ndjson streams a header line followed by one
+    annotation per line. ?gzip=1 compresses either streamed form on the fly.
+    """
+    project = _cached_project(project_id)
     if not project or project.get('user_id') != str(current_user['_id']):
         return jsonify({"error": "Project not found or unauthorized"}), 404
 
@@ -289,20 +1041,19 @@ def export_project_annotations(current_user, project_id):
         'username': current_user.get('username'),
     }
 
+    fmt = request.args.get('format', 'json')
+    if fmt not in ('json', 'ndjson'):
+        return jsonify({"error": "format must be json or ndjson"}), 400
+    stream = fmt == 'ndjson' or request.args.get('stream') in ('1', 'true')
+
     # Gather annotations
-    cursor = mongo.db.annotations.find({
-        'user_id': str(current_user['_id']),
-        'project_id': str(project['_id'])
-    }).sort([('video_index', 1), ('sample_index', 1)])
-    annotations = []
-    for doc in cursor:
-        annotations.append({
-            'video_index': int(doc.get('video_index', 0)),
-            'sample_index': int(doc.get('sample_index', 0)),
-            'boxes': doc.get('boxes') or [],
-            'updated_at': doc.get('updated_at').isoformat() if doc.get('updated_at') else None,
-            'created_at': doc.get('created_at').isoformat() if doc.get('created_at') else None,
-        })
+    cursor = mongo.db.annotations.find(
+        {
+            'user_id': str(current_user['_id']),
+            'project_id': str(project['_id'])
+        },
+        {'_id': 0, 'video_index': 1, 'sample_index': 1, 'boxes': 1, 'updated_at': 1, 'created_at': 1},
+    ).sort([('video_index', 1), ('sample_index', 1)])
 
     payload = {
         'schema_version': 1,
@@ -316,24 +1067,144 @@ def export_project_annotations(current_user, project_id):
             'attributes': project.get('attributes') or {},
         },
         'user': user_info,
-        'annotations': annotations,
     }
+    filename = f"annotations_{str(project['_id'])}.{fmt}"
 
-    data = json.dumps(payload, ensure_ascii=False, indent=2).encode('utf-8')
-    filename = f"annotations_{str(project['_id'])}.json"
-    return Response(data, mimetype='application/json', headers={
-        'Content-Disposition': f'attachment; filename="{filename}"'
-    })
+    if not stream:
+        payload['annotations'] = [_export_annotation_item(doc) for doc in cursor]
+        data = json.dumps(payload, ensure_ascii=False, indent=2).encode('utf-8')
+        return Response(data, mimetype='application/json', headers={
+            'Content-Disposition': f'attachment; filename="{filename}"'
+        })
+
+    cursor = cursor.batch_size(app.config['EXPORT_BATCH_SIZE'])
+
+    def generate_json():
+        # same document as the buffered export, minus the indentation
+        head = json.dumps(payload, ensure_ascii=False)
+        yield (head[:-1] + ', "annotations": [').encode('utf-8')
+        first = True
+        for doc in cursor:
+            item = json.dumps(_export_annotation_item(doc), ensure_ascii=False)
+            yield (item if first else ',' + item).encode('utf-8')
+            first = False
+        yield b']}'
+
+    def generate_ndjson():
+        yield (json.dumps(payload, ensure_ascii=False) + '\n').encode('utf-8')
+        for doc in cursor:
+            yield (json.dumps(_export_annotation_item(doc), ensure_ascii=False) + '\n').encode('utf-8')
+
+    body = generate_ndjson() if fmt == 'ndjson' else generate_json()
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+    if request.args.get('gzip') in ('1', 'true'):
+        body = _gzip_stream(body)
+        headers['Content-Encoding'] = 'gzip'
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+    return Response(body, mimetype=mimetype, headers=headers)
+
+
+def _import_chunk_size():
+    size = request.args.get('chunk_size', default=app.config['IMPORT_CHUNK_SIZE'], type=int)
+    return max(1, min(size, 10000))
+
+
+def _parse_import_annotations(annos):
+    """Validate exported annotation items into (video_index, sample_index, boxes) tuples."""
+    items = []
+    for item in annos:
+        try:
+            vi = int(item.get('video_index'))
+            si = int(item.get('sample_index'))
+        except Exception:
+            continue
+        boxes = item.get('boxes')
+        if not isinstance(boxes, list):
+            continue
+        items.append((vi, si, boxes))
+    return items
+
+
+def _latest_per_frame(items):
+    """Collapse repeated (video_index, sample_index) items, keeping the last one.
+
+    Sequential upserts used to leave the last item behind; unordered bulk ops give no
+    ordering guarantee, so duplicates are resolved here instead.
+    """
+    latest = {}
+    for vi, si, boxes in items:
+        latest[(vi, si)] = boxes
+    return [(vi, si, boxes) for (vi, si), boxes in latest.items()]
+
+
+def _bulk_upsert_annotations(user_id, project_id, items, chunk_size):
+    """Upsert frame docs with unordered bulk_write chunks. Returns (count, per-chunk stats)."""
+    now = datetime.datetime.utcnow()
+    unique = _latest_per_frame(items)
+    chunks = []
+    for start in range(0, len(unique), chunk_size):
+        batch = unique[start:start + chunk_size]
+        ops = [
+            UpdateOne(
+                {
+                    'user_id': user_id,
+                    'project_id': project_id,
+                    'video_index': vi,
+                    'sample_index': si,
+                },
+                {
+                    '$set': {
+                        'boxes': boxes,
+                        'updated_at': now,
+                    },
+                    '$inc': {'version': 1},
+                    '$setOnInsert': {
+                        'created_at': now,
+                    }
+                },
+                upsert=True
+            )
+            for vi, si, boxes in batch
+        ]
+        res = mongo.db.annotations.bulk_write(ops, ordered=False)
+        chunks.append({
+            'size': len(ops),
+            'matched': res.matched_count,
+            'modified': res.modified_count,
+            'upserted': res.upserted_count,
+        })
+    _invalidate_stats(user_id, project_id, {vi for vi, _, _ in unique})
+    return len(items), chunks
+
+
+def _bulk_insert_annotations(user_id, project_id, items, chunk_size):
+    """insert_many fast path for a project with no annotations yet."""
+    now = datetime.datetime.utcnow()
+    docs = [
+        {
+            'user_id': user_id,
+            'project_id': project_id,
+            'video_index': vi,
+            'sample_index': si,
+            'boxes': boxes,
+            'version': 1,
+            'created_at': now,
+            'updated_at': now,
+        }
+        for vi, si, boxes in _latest_per_frame(items)
+    ]
+    chunks = []
+    for start in range(0, len(docs), chunk_size):
+        res = mongo.db.annotations.insert_many(docs[start:start + chunk_size], ordered=False)
+        chunks.append({'size': len(res.inserted_ids), 'inserted': len(res.inserted_ids)})
+    return len(items), chunks
 
 
 @app.route('/api/projects/<project_id>/import', methods=['POST'])
 @token_required
 def import_project_annotations(current_user, project_id):
     """Import annotations JSON for this project. Optionally updates classes/attributes."""
-    try:
-        project = mongo.db.projects.find_one({'_id': ObjectId(project_id)})
-    except Exception:
-        project = None
+    project = _cached_project(project_id)
     if not project or project.get('user_id') != str(current_user['_id']):
         return jsonify({"error": "Project not found or unauthorized"}), 404
 
@@ -360,39 +1231,14 @@ def import_project_annotations(current_user, project_id):
     if updates:
         updates['updated_at'] = datetime.datetime.utcnow()
         mongo.db.projects.update_one({'_id': project['_id']}, {'$set': updates})
+        _invalidate_project(project['_id'])
 
-    # Upsert annotations
-    count = 0
-    for item in annos:
-        try:
-            vi = int(item.get('video_index'))
-            si = int(item.get('sample_index'))
-        except Exception:
-            continue
-        boxes = item.get('boxes')
-        if not isinstance(boxes, list):
-            continue
-        mongo.db.annotations.update_one(
-            {
-                'user_id': str(current_user['_id']),
-                'project_id': str(project['_id']),
-                'video_index': vi,
-                'sample_index': si,
-            },
-            {
-                '$set': {
-                    'boxes': boxes,
-                    'updated_at': datetime.datetime.utcnow(),
-                },
-                '$setOnInsert': {
-                    'created_at': datetime.datetime.utcnow(),
-                }
-            },
-            upsert=True
-        )
-        count += 1
+    # Upsert annotations in unordered bulk chunks
+    items = _parse_import_annotations(annos)
+    count, chunks = _bulk_upsert_annotations(
+        str(current_user['_id']), str(project['_id']), items, _import_chunk_size())
 
-    return jsonify({"success": True, "imported": count})
+    return jsonify({"success": True, "imported": count, "chunks": chunks})
 
 
 @app.route('/api/projects/import', methods=['POST'])
@@ -440,37 +1286,10 @@ def import_full_project(current_user):
     res = mongo.db.projects.insert_one(doc)
     new_pid = res.inserted_id
 
-    # import annotations
-    annos = payload.get('annotations') or []
-    imported = 0
-    for item in annos:
-        try:
-            vi = int(item.get('video_index'))
-            si = int(item.get('sample_index'))
-        except Exception:
-            continue
-        boxes = item.get('boxes')
-        if not isinstance(boxes, list):
-            continue
-        mongo.db.annotations.update_one(
-            {
-                'user_id': str(current_user['_id']),
-                'project_id': str(new_pid),
-                'video_index': vi,
-                'sample_index': si,
-            },
-            {
-                '$set': {
-                    'boxes': boxes,
-                    'updated_at': datetime.datetime.utcnow(),
-                },
-                '$setOnInsert': {
-                    'created_at': datetime.datetime.utcnow(),
-                }
-            },
-            upsert=True
-        )
-        imported += 1
+    # import annotations; the project is brand new, so plain inserts cannot collide
+    items = _parse_import_annotations(payload.get('annotations') or [])
+    imported, chunks = _bulk_insert_annotations(
+        str(current_user['_id']), str(new_pid), items, _import_chunk_size())
 
     return jsonify({
         'success': True,
@@ -481,6 +1300,7 @@ def import_full_project(current_user):
         'classes': classes,
         'attributes': attributes,
         'imported': imported,
+        'chunks': chunks,
     })
 
 
@@ -494,6 +1314,335 @@ def _safe_video_path(base_dir, filename):
     return path
 
 
+class _PooledCapture:
+    """An open VideoCapture plus the decoder position it is currently at.
+
+    `lock` must be held while touching `cap`; a capture is never shared between
+    two concurrent reads. `users` (guarded by the pool lock) counts acquire()
+    holders, including those still waiting for `lock`; the pool only closes a
+    capture once it drops to zero.
+    """
+
+    def __init__(self, path, mtime):
+        self.path = path
+        self.mtime = mtime
+        self.cap = cv2.VideoCapture(path)
+        self.lock = threading.Lock()
+        # frame index the next cap.read() will return, or None if unknown
+        self.next_frame = 0
+        self.last_used = time.monotonic()
+        self.users = 0
+        # dropped from the pool while in use; the last holder closes it
+        self.retired = False
+
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    def read_frame(self, frame_num, keyframes=None):
+        """Decode `frame_num`, reading forward from the current position when cheap."""
+        timings = {} if _INSTRUMENTED else None
+        ok, frame, self.next_frame = decode_worker.seek_read(
+            self.cap, self.next_frame, frame_num, keyframes,
+            app.config['CAPTURE_MAX_FORWARD_GRAB'], timings)
+        if timings:
+            for name, seconds in timings.items():
+                _record_stage(name, seconds)
+        return ok, frame
+
+    def release(self):
+        with self.lock:
+            self.cap.release()
+
+
+class _CapturePool:
+    """LRU pool of open captures keyed by video path, local to one worker process.
+
+    Only idle captures are evicted, so the pool can briefly hold more than
+    `max_size` while every one of them is being read. Opening happens outside the
+    pool lock: a slow NAS open stalls only the requests for that video.
+    """
+
+    def __init__(self, max_size, idle_timeout):
+        self.max_size = max(1, int(max_size))
+        self.idle_timeout = float(idle_timeout)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _checkout_locked(self, path, mtime, stale):
+        entry = self._entries.get(path)
+        if entry is not None and entry.mtime != mtime:
+            # file was replaced on disk; never reuse the old decoder
+            self._retire_locked(self._entries.pop(path), stale)
+            entry = None
+        if entry is not None:
+            entry.users += 1
+            self._entries.move_to_end(path)
+        return entry
+
+    @staticmethod
+    def _retire_locked(entry, stale):
+        if entry.users:
+            entry.retired = True
+        else:
+            stale.append(entry)
+
+    def _trim_locked(self, stale):
+        stale.extend(self._expire_locked())
+        for p in [p for p, e in self._entries.items() if not e.users]:
+            if len(self._entries) <= self.max_size:
+                break
+            stale.append(self._entries.pop(p))
+
+    @contextmanager
+    def acquire(self, path):
+        """Yield a locked, opened _PooledCapture for `path`, or None if it cannot be opened."""
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            yield None
+            return
+
+        stale = []
+        with self._lock:
+            entry = self._checkout_locked(path, mtime, stale)
+        if entry is None:
+            with _stage('open'):
+                opened = _PooledCapture(path, mtime)
+            if not opened.is_opened():
+                stale.append(opened)
+            else:
+                with self._lock:
+                    # another request may have opened the same file meanwhile
+                    entry = self._checkout_locked(path, mtime, stale)
+                    if entry is None:
+                        entry = opened
+                        entry.users = 1
+                        self._entries[path] = entry
+                    else:
+                        stale.append(opened)
+                    self._trim_locked(stale)
+
+        # release outside the pool lock
+        for old in stale:
+            old.release()
+
+        if entry is None:
+            yield None
+            return
+
+        try:
+            with entry.lock:
+                try:
+                    yield entry
+                finally:
+                    entry.last_used = time.monotonic()
+        finally:
+            stale = []
+            with self._lock:
+                entry.users -= 1
+                if entry.retired and not entry.users:
+                    stale.append(entry)
+                self._trim_locked(stale)
+            for old in stale:
+                old.release()
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _expire_locked(self):
+        if self.idle_timeout <= 0:
+            return []
+        cutoff = time.monotonic() - self.idle_timeout
+        expired = [p for p, e in self._entries.items() if not e.users and e.last_used < cutoff]
+        return [self._entries.pop(p) for p in expired]
+
+    def clear(self):
+        stale = []
+        with self._lock:
+            for entry in self._entries.values():
+                self._retire_locked(entry, stale)
+            self._entries.clear()
+        for entry in stale:
+            entry.release()
+
+
+capture_pool = _CapturePool(app.config['CAPTURE_POOL_SIZE'], app.config['CAPTURE_IDLE_TIMEOUT'])
+
+
+def _read_frame(video_path, frame_num, keyframes=None):
+    """Decode a single raw frame through the capture pool. Returns (frame, error)."""
+    with capture_pool.acquire(video_path) as pc:
+        if pc is None:
+            return None, ("Failed to open video", 500)
+        ok, frame = pc.read_frame(frame_num, keyframes)
+    if not ok or frame is None:
+        return None, ("Failed to read frame", 500)
+    return frame, None
+
+
+# -------- Video metadata index --------
+#
+# Container properties only change when the file does, so they are probed once and
+# stored in the `video_meta` collection keyed by path + mtime + size. Every gunicorn
+# worker shares that collection and keeps its own small in-process copy on top.
+
+_VIDEO_META_LOCAL_MAX = 1024
+_video_meta_local = OrderedDict()
+_video_meta_local_lock = threading.Lock()
+
+
+def _fourcc_to_str(value):
+    code = int(value or 0)
+    if code <= 0:
+        return None
+    return ''.join(chr((code >> (8 * i)) & 0xFF) for i in range(4)).strip('\x00 ') or None
+
+
+def _yield_to_requests():
+    """Let other requests run between frames of a long decode loop; a no-op unless async."""
+    if _ASYNC_MODE:
+        time.sleep(0)
+
+
+def _probe_video(video_path):
+    """Open the container and read fps, frame count, dimensions and codec from its headers."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return None
+    try:
+        return {
+            'raw_fps': float(cap.get(cv2.CAP_PROP_FPS) or 0.0),
+            'total_frames': int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0),
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0),
+            'codec': _fourcc_to_str(cap.get(cv2.CAP_PROP_FOURCC)),
+            'keyframes': None,
+        }
+    finally:
+        cap.release()
+
+
+def _scan_keyframes(video_path):
+    """Keyframe indices from a demux-only pass (packets are not decoded), or None."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return None
+    try:
+        if not cap.set(cv2.CAP_PROP_FORMAT, -1):
+            return None
+        keyframes = []
+        idx = 0
+        while cap.grab():
+            if cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                keyframes.append(idx)
+            idx += 1
+            if idx % 256 == 0:
+                _yield_to_requests()
+        return keyframes
+    finally:
+        cap.release()
+
+
+# Reading every packet of a multi-GB file takes far longer than a request may, so
+# the keyframe scan runs on _keyframe_executor after the header probe has been
+# stored. One worker claims it through `keyframes_scan_at`; a claim older than
+# _KEYFRAME_SCAN_STALE seconds is assumed lost with its worker and taken over.
+# Until the keyframes land, seeks simply fall back to the decoder's own.
+_KEYFRAME_SCAN_STALE = 600
+# how often a worker re-reads a cached doc whose keyframes are still missing
+_KEYFRAME_RECHECK = 5.0
+_video_meta_checked = {}
+# separate from _extract_executor so a long extraction never delays the scans seeks rely on
+_keyframe_executor = ThreadPoolExecutor(max_workers=max(1, app.config['KEYFRAME_SCAN_WORKERS']),
+                                        thread_name_prefix='keyframes')
+
+
+def _keyframes_done(doc):
+    return doc.get('keyframes') is not None or bool(doc.get('keyframes_scanned'))
+
+
+def _run_keyframe_scan(video_path, mtime, size):
+    try:
+        keyframes = _scan_keyframes(video_path)
+    except Exception as e:
+        app.logger.warning('keyframe scan of %s failed: %s', video_path, e)
+        keyframes = None
+    # recorded even when the container does not support it, so it is not retried
+    mongo.db.video_meta.update_one({'_id': video_path, 'mtime': mtime, 'size': size},
+                                   {'$set': {'keyframes': keyframes, 'keyframes_scanned': True}})
+    with _video_meta_local_lock:
+        cached = _video_meta_local.get(video_path)
+        if cached is not None and cached['mtime'] == mtime and cached['size'] == size:
+            _video_meta_local[video_path] = dict(cached, keyframes=keyframes, keyframes_scanned=True)
+
+
+def _claim_keyframe_scan(doc):
+    now = datetime.datetime.utcnow()
+    res = mongo.db.video_meta.update_one(
+        {'_id': doc['_id'], 'mtime': doc['mtime'], 'size': doc['size'],
+         'keyframes_scanned': {'$ne': True},
+         '$or': [{'keyframes_scan_at': None},
+                 {'keyframes_scan_at': {'$lt': now - datetime.timedelta(seconds=_KEYFRAME_SCAN_STALE)}}]},
+        {'$set': {'keyframes_scan_at': now}})
+    if res.modified_count:
+        _keyframe_executor.submit(_run_keyframe_scan, doc['_id'], doc['mtime'], doc['size'])
+
+
+def _video_meta(video_path, scan_keyframes=True):
+    """Return the cached metadata dict for `video_path`, probing it if the file changed.
+
+    Only the container headers are read inline; keyframes are filled in later by a
+    background scan (VIDEO_META_KEYFRAMES) unless `scan_keyframes` is False, as for
+    directory listings. Returns None if the file is missing or cannot be opened.
+    """
+    try:
+        st = os.stat(video_path)
+    except OSError:
+        return None
+    mtime, size = st.st_mtime, st.st_size
+    want_keyframes = scan_keyframes and app.config['VIDEO_META_KEYFRAMES']
+
+    with _video_meta_local_lock:
+        cached = _video_meta_local.get(video_path)
+        if cached is not None and cached['mtime'] == mtime and cached['size'] == size:
+            if (not want_keyframes or _keyframes_done(cached)
+                    or time.monotonic() - _video_meta_checked.get(video_path, 0) < _KEYFRAME_RECHECK):
+                _video_meta_local.move_to_end(video_path)
+                return cached
+
+    doc = mongo.db.video_meta.find_one({'_id': video_path, 'mtime': mtime, 'size': size})
+    if doc is None:
+        with _stage('probe'):
+            probed = _probe_video(video_path)
+        if probed is None:
+            return None
+        doc = dict(probed, _id=video_path, mtime=mtime, size=size,
+                   probed_at=datetime.datetime.utcnow())
+        mongo.db.video_meta.replace_one({'_id': video_path}, doc, upsert=True)
+    if want_keyframes and not _keyframes_done(doc):
+        _claim_keyframe_scan(doc)
+
+    with _video_meta_local_lock:
+        _video_meta_local[video_path] = doc
+        _video_meta_local.move_to_end(video_path)
+        _video_meta_checked[video_path] = time.monotonic()
+        while len(_video_meta_local) > _VIDEO_META_LOCAL_MAX:
+            evicted, _ = _video_meta_local.popitem(last=False)
+            _video_meta_checked.pop(evicted, None)
+    return doc
+
+
+def _index_project_videos(video_directory, selected_videos):
+    """Warm the metadata index for every selected video; unreadable files are skipped."""
+    for name in selected_videos:
+        if not isinstance(name, str):
+            continue
+        path = _safe_video_path(video_directory, name)
+        if path and os.path.isfile(path):
+            _video_meta(path)
+
+
 def _video_info_for(project, video_index):
     videos = project.get('selected_videos') or []
     if video_index < 0 or video_index >= len(videos):
@@ -503,13 +1652,12 @@ def _video_info_for(project, video_index):
     if not video_path or not os.path.isfile(video_path):
         return None, ("Video not found on server", 404)
 
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
+    with _stage('video_meta'):
+        meta = _video_meta(video_path)
+    if meta is None:
         return None, ("Failed to open video", 500)
-
-    raw_fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
-    cap.release()
+    raw_fps = meta['raw_fps']
+    total_frames = meta['total_frames']
 
     target_fps = int(project.get('fps') or 1)
     target_fps = max(1, target_fps)
@@ -526,86 +1674,1562 @@ def _video_info_for(project, video_index):
         'target_fps': target_fps,
         'step': step,
         'sampled_count': sampled_count,
+        'width': meta.get('width') or 0,
+        'height': meta.get('height') or 0,
+        'keyframes': meta.get('keyframes'),
+        'mtime': meta['mtime'],
+        'size': meta['size'],
     }, None
 
 
-@app.route('/api/projects/<project_id>/video_info', methods=['GET'])
-@token_required
-def get_video_info(current_user, project_id):
-    try:
-        project = mongo.db.projects.find_one({'_id': ObjectId(project_id)})
-    except Exception:
-        project = None
-    if not project or project.get('user_id') != str(current_user['_id']):
-        return jsonify({"error": "Project not found or unauthorized"}), 404
+def _sample_frame_num(info, sample_index):
+    """Raw frame number of a sampled frame, clamped to the last frame."""
+    return min(sample_index * info['step'], max(0, info['total_frames'] - 1))
 
-    vi = request.args.get('video_index', default=0, type=int)
-    info, err = _video_info_for(project, vi)
-    if err:
-        msg, code = err
-        return jsonify({"error": msg}), code
 
-    return jsonify({
-        'raw_fps': info['raw_fps'],
-        'total_frames': info['total_frames'],
-        'target_fps': info['target_fps'],
-        'step': info['step'],
-        'sampled_count': info['sampled_count']
-    })
+# -------- Encoded frame cache --------
 
+class _FrameCache:
+    """Byte-bounded cache of encoded frames.
 
-@app.route('/api/projects/<project_id>/frame', methods=['GET'])
-@token_required
-def get_frame(current_user, project_id):
-    try:
-        project = mongo.db.projects.find_one({'_id': ObjectId(project_id)})
-    except Exception:
-        project = None
-    if not project or project.get('user_id') != str(current_user['_id']):
-        return jsonify({"error": "Project not found or unauthorized"}), 404
+    The memory tier is an LRU private to this worker. When `disk_dir` is set, entries
+    are also written there as plain files so every worker on the host can reuse them;
+    that tier is trimmed by file mtime (bumped on every hit) once it exceeds
+    `disk_max_bytes`.
+    """
 
-    video_index = request.args.get('video_index', default=0, type=int)
-    sample_index = request.args.get('sample_index', default=0, type=int)
+    _SWEEP_EVERY = 256
+
+    def __init__(self, max_bytes, disk_dir='', disk_max_bytes=0):
+        self.max_bytes = max(0, int(max_bytes))
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = max(0, int(disk_max_bytes))
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._puts_since_sweep = 0
+        self.counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'disk_evictions': 0,
+        }
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return data
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, 'rb') as fh:
+                    data = fh.read()
+                os.utime(path)
+            except OSError:
+                data = None
+            if data:
+                self._put_memory(key, data)
+                with self._lock:
+                    self.counters['disk_hits'] += 1
+                return data
+
+        with self._lock:
+            self.counters['misses'] += 1
+        return None
 
-    info, err = _video_info_for(project, video_index)
+    def contains(self, key):
+        """Memory-tier membership test that does not touch the counters or LRU order."""
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, data):
+        self._put_memory(key, data)
+        if self.disk_dir:
+            self._put_disk(key, data)
+
+    def _put_memory(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.counters['evictions'] += 1
+
+    def _put_disk(self, key, data):
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write-then-rename so other workers never read a partial file
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            app.logger.warning('frame cache: failed to write %s', path)
+            return
+        with self._lock:
+            self._puts_since_sweep += 1
+            sweep = self._puts_since_sweep >= self._SWEEP_EVERY
+            if sweep:
+                self._puts_since_sweep = 0
+        if sweep:
+            self._sweep_disk()
+
+    def _sweep_disk(self):
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= self.disk_max_bytes:
+            return
+        # trim to 90% so we do not sweep again on the very next write
+        target = int(self.disk_max_bytes * 0.9)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        with self._lock:
+            self.counters['disk_evictions'] += removed
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.counters)
+            out['entries'] = len(self._entries)
+            out['bytes'] = self._bytes
+        out['max_bytes'] = self.max_bytes
+        out['disk_enabled'] = bool(self.disk_dir)
+        out['pid'] = os.getpid()
+        return out
+
+
+frame_cache = _FrameCache(
+    app.config['FRAME_CACHE_MAX_BYTES'],
+    app.config['FRAME_CACHE_DIR'],
+    app.config['FRAME_CACHE_DISK_MAX_BYTES'],
+)
+
+# Render spec: (extension, width, height, quality, crop). Part of every cache key.
+# width/height of 0 keep the source size; quality 0 means the encoder default;
+# crop is a normalized (x, y, w, h) region of interest or None.
+_DEFAULT_ENCODE = ('.jpg', 0, 0, 0, None)
+
+_RENDER_FORMATS = {
+    'jpeg': ('.jpg', 'image/jpeg'),
+    'jpg': ('.jpg', 'image/jpeg'),
+    'webp': ('.webp', 'image/webp'),
+    'png': ('.png', 'image/png'),
+}
+_RENDER_MIMETYPES = {ext: mime for ext, mime in _RENDER_FORMATS.values()}
+_RENDER_MAX_SIDE = 8192
+
+
+def _render_spec_from_args(args):
+    """Parse ?width, ?height, ?quality, ?format and ?crop=x,y,w,h into a render spec.
+
+    Returns (spec, error). Without any of these parameters the spec is _DEFAULT_ENCODE,
+    so plain /frame requests keep sharing cache entries and pre-extracted frames.
+    """
+    fmt = (args.get('format') or 'jpeg').lower()
+    if fmt not in _RENDER_FORMATS:
+        return None, ("format must be jpeg, webp or png", 400)
+    ext = _RENDER_FORMATS[fmt][0]
+
+    width = args.get('width', default=0, type=int)
+    height = args.get('height', default=0, type=int)
+    if width < 0 or height < 0 or width > _RENDER_MAX_SIDE or height > _RENDER_MAX_SIDE:
+        return None, (f"width and height must be between 0 and {_RENDER_MAX_SIDE}", 400)
+
+    quality = args.get('quality', default=0, type=int)
+    if quality and not 1 <= quality <= 100:
+        return None, ("quality must be between 1 and 100", 400)
+    if ext == '.png':
+        quality = 0
+
+    crop = None
+    raw = args.get('crop')
+    if raw:
+        try:
+            x, y, w, h = (float(v) for v in raw.split(','))
+        except ValueError:
+            return None, ("crop must be x,y,w,h in normalized [0,1] coordinates", 400)
+        # nan passes straight through the min/max clamping below
+        if not all(math.isfinite(v) for v in (x, y, w, h)):
+            return None, ("crop must be x,y,w,h in normalized [0,1] coordinates", 400)
+        x, y = min(max(x, 0.0), 1.0), min(max(y, 0.0), 1.0)
+        w, h = min(max(w, 0.0), 1.0 - x), min(max(h, 0.0), 1.0 - y)
+        if w <= 0 or h <= 0:
+            return None, ("crop region is empty", 400)
+        # rounded so near-identical zoom requests share a cache entry
+        crop = tuple(round(v, 4) for v in (x, y, w, h))
+
+    return (ext, width, height, quality, crop), None
+
+
+def _frame_cache_key(info, frame_num, encode=_DEFAULT_ENCODE):
+    """Content key for an encoded frame; changes whenever the source file does."""
+    raw = '|'.join([info['video_path'], repr(info['mtime']), str(info['size']),
+                    str(frame_num), repr(encode)])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _frame_store_serves(info, encode):
+    """Whether `encode` may be rendered from the stored JPEG instead of the video.
+
+    Only same-format, same-quality downscales qualify: a PNG would silently carry
+    JPEG artifacts, and a crop or upscale would magnify them.
+    """
+    ext, width, height, quality, crop = encode
+    return (ext == _DEFAULT_ENCODE[0] and quality == _DEFAULT_ENCODE[3] and crop is None
+            and width <= (info.get('width') or 0) and height <= (info.get('height') or 0))
+
+
+def _encoded_frame(info, frame_num, encode=_DEFAULT_ENCODE, user_id=None, admitted=False):
+    """Return (bytes, cache_key, error) for a frame, decoding and encoding only on a miss.
+
+    `user_id` is the admission-control bucket when the decode pool is enabled;
+    `admitted` means the caller already holds a decode_pool.admission() slot.
+    """
+    key = _frame_cache_key(info, frame_num, encode)
+    with _stage('cache'):
+        data = frame_cache.get(key)
+    if data is not None:
+        return data, key, None
+
+    with _stage('frame_store'):
+        stored = _frame_store_read(info, frame_num)
+    if stored is not None and encode == _DEFAULT_ENCODE:
+        frame_cache.put(key, stored)
+        return stored, key, None
+
+    frame = None
+    if stored is not None and _frame_store_serves(info, encode):
+        # a stored JPEG decodes far faster than seeking in the video
+        frame = cv2.imdecode(np.frombuffer(stored, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None and decode_pool.enabled:
+        data, err = decode_pool.render(user_id, info, frame_num, encode, admitted)
+        if err:
+            return None, key, err
+    else:
+        if frame is None:
+            frame, err = _read_frame(info['video_path'], frame_num, info['keyframes'])
+            if err:
+                return None, key, err
+        with _stage('encode'):
+            data = decode_worker.render_frame(frame, encode)
+        if data is None:
+            return None, key, ("Failed to encode frame", 500)
+
+    frame_cache.put(key, data)
+    return data, key, None
+
+
+# -------- Decode process pool --------
+
+def _preceding_keyframe(keyframes, frame_num):
+    """[last keyframe <= frame_num], all seek_read() needs; keeps job pickles tiny."""
+    if not keyframes:
+        return None
+    k = bisect.bisect_right(keyframes, frame_num) - 1
+    return [keyframes[k]] if k >= 0 else []
+
+
+class _DecodePool:
+    """Bounded process pool for decode + encode, so API workers stay free for cheap routes.
+
+    Admission control happens before anything is queued: at most `max_queue` jobs in
+    flight per API worker and `per_user` per user, otherwise the caller gets a 503
+    to turn into Retry-After. A batch request takes one slot through admission() for
+    all of its frames, which are bounded by the batch executor instead. Every job carries a deadline; a job still queued when
+    it passes (a scrub the annotator has moved on from) is dropped by the decode
+    process, and the caller stops waiting at the same moment. Encoded bytes come
+    back through shared memory rather than the result pipe.
+    """
+
+    def __init__(self, workers, max_queue, per_user, deadline):
+        self.workers = max(0, int(workers))
+        self.max_queue = max(1, int(max_queue))
+        self.per_user = max(1, int(per_user))
+        self.deadline = float(deadline)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._by_user = {}
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def in_flight(self):
+        with self._lock:
+            return self._inflight
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn: never fork a process that holds Mongo sockets and threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=decode_worker.worker_init)
+        return self._executor
+
+    def _admit(self, user_id):
+        with self._lock:
+            if self._inflight >= self.max_queue:
+                return False
+            if self._by_user.get(user_id, 0) >= self.per_user:
+                return False
+            self._inflight += 1
+            self._by_user[user_id] = self._by_user.get(user_id, 0) + 1
+            return True
+
+    def _release(self, user_id):
+        with self._lock:
+            self._inflight -= 1
+            left = self._by_user.get(user_id, 1) - 1
+            if left > 0:
+                self._by_user[user_id] = left
+            else:
+                self._by_user.pop(user_id, None)
+
+    @contextmanager
+    def admission(self, user_id):
+        """Hold one admission slot for a whole request; yields False if it is rejected."""
+        if not self.enabled:
+            yield True
+            return
+        if not self._admit(user_id):
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            self._release(user_id)
+
+    def render(self, user_id, info, frame_num, encode, admitted=False):
+        """Decode+encode in the pool. Returns (bytes, error); error code 503 means retry."""
+        if not admitted and not self._admit(user_id):
+            return None, ("Frame decoder is busy", 503)
+        try:
+            deadline = time.time() + self.deadline
+            with self._lock:
+                executor = self._get_executor()
+            try:
+                fut = executor.submit(
+                    decode_worker.decode_to_shm, info['video_path'], info['mtime'], frame_num,
+                    _preceding_keyframe(info['keyframes'], frame_num), encode, deadline,
+                    app.config['CAPTURE_MAX_FORWARD_GRAB'])
+                with _stage('decode_pool'):
+                    result = fut.result(timeout=max(0.0, deadline - time.time()) + 0.5)
+            except FutureTimeoutError:
+                if not fut.cancel():
+                    # still running: free its shared memory whenever it finishes
+                    fut.add_done_callback(lambda f: f.cancelled() or f.exception()
+                                          or decode_worker.discard_result(f.result()))
+                return None, ("Frame request expired", 503)
+            except BrokenProcessPool:
+                app.logger.error('decode pool broke; restarting it')
+                with self._lock:
+                    self._executor = None
+                return None, ("Frame decoder restarted", 503)
+        finally:
+            if not admitted:
+                self._release(user_id)
+
+        if result[0] == 'expired':
+            return None, ("Frame request expired", 503)
+        if result[0] == 'error':
+            return None, (result[1], 500)
+        if _INSTRUMENTED:
+            # measured inside the decode process; decode_pool above includes them plus queueing
+            for name, seconds in result[3].items():
+                _record_stage(name, seconds)
+        return decode_worker.take_shm(result[1], result[2]), None
+
+
+decode_pool = _DecodePool(app.config['DECODE_POOL_WORKERS'], app.config['DECODE_MAX_QUEUE'],
+                          app.config['DECODE_MAX_PER_USER'], app.config['DECODE_DEADLINE'])
+
+
+# -------- Frame prefetch --------
+
+class _Prefetcher:
+    """Warms the frame cache around the sample a user just requested.
+
+    Work is tracked per user: a new window cancels that user's queued jobs that fell
+    out of it, and at most `per_user` jobs are pending per user, so one fast annotator
+    cannot fill the executor queue ahead of everyone else. A key already in flight for
+    anyone is never scheduled twice.
+    """
+
+    def __init__(self, workers, per_user):
+        self.per_user = max(1, int(per_user))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(workers)),
+                                            thread_name_prefix='prefetch')
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._by_user = {}
+
+    def schedule(self, user_id, info, frame_nums, encode=_DEFAULT_ENCODE):
+        wanted = {_frame_cache_key(info, n, encode): n for n in frame_nums}
+        submitted = []
+        stale = []
+        with self._lock:
+            queue = self._by_user.setdefault(user_id, OrderedDict())
+            for key, fut in list(queue.items()):
+                # jobs already running finish and clean up after themselves
+                if key not in wanted and not fut.running():
+                    del queue[key]
+                    if self._inflight.get(key) is fut:
+                        del self._inflight[key]
+                    stale.append(fut)
+            for key, frame_num in wanted.items():
+                if len(queue) >= self.per_user:
+                    break
+                if key in self._inflight or frame_cache.contains(key):
+                    continue
+                fut = self._executor.submit(self._run, info, frame_num, encode)
+                self._inflight[key] = fut
+                queue[key] = fut
+                submitted.append((key, fut))
+            if not queue:
+                del self._by_user[user_id]
+        # cancel() and add_done_callback() can run _forget inline, so both stay outside the lock
+        for fut in stale:
+            fut.cancel()
+        for key, fut in submitted:
+            fut.add_done_callback(lambda f, u=user_id, k=key: self._forget(u, k, f))
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._inflight)
+
+    def _forget(self, user_id, key, fut):
+        with self._lock:
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
+            queue = self._by_user.get(user_id)
+            if queue is not None and queue.get(key) is fut:
+                del queue[key]
+                if not queue:
+                    del self._by_user[user_id]
+
+    @staticmethod
+    def _run(info, frame_num, encode):
+        # all prefetch work shares one admission bucket so it never crowds out live requests
+        _, _, err = _encoded_frame(info, frame_num, encode, 'prefetch')
+        if err:
+            app.logger.debug('prefetch of frame %s in %s failed: %s',
+                              frame_num, info['video_path'], err[0])
+
+
+prefetcher = _Prefetcher(app.config['FRAME_PREFETCH_WORKERS'], app.config['FRAME_PREFETCH_PER_USER'])
+
+
+def _prefetch_window(user_id, info, sample_index, ahead, behind, encode=_DEFAULT_ENCODE):
+    """Schedule N+1..N+ahead (nearest first) and N-1..N-behind for background decode."""
+    last = info['sampled_count'] - 1
+    samples = [sample_index + d for d in range(1, ahead + 1)]
+    samples += [sample_index - d for d in range(1, behind + 1)]
+    frame_nums = [_sample_frame_num(info, si) for si in samples if 0 <= si <= last]
+    if frame_nums:
+        prefetcher.schedule(user_id, info, frame_nums, encode)
+
+
+# -------- Pre-extracted frame store --------
+#
+# A job decodes a video once, front to back, and writes every `step`-th frame as a
+# JPEG under FRAME_STORE_DIR/<video identity>/<frame_num>.jpg. /frame reads from
+# there first and only decodes live for frames the job has not reached yet.
+# Progress lives in the `extract_jobs` collection so any worker can report it.
+
+_EXTRACT_STALE_SECONDS = 300
+_extract_executor = ThreadPoolExecutor(max_workers=max(1, app.config['EXTRACT_WORKERS']),
+                                       thread_name_prefix='extract')
+
+
+def _frame_store_dir(info):
+    raw = '|'.join([info['video_path'], repr(info['mtime']), str(info['size'])])
+    return os.path.join(app.config['FRAME_STORE_DIR'], hashlib.sha1(raw.encode('utf-8')).hexdigest())
+
+
+def _frame_store_read(info, frame_num):
+    path = os.path.join(_frame_store_dir(info), f'{frame_num:08d}.jpg')
+    try:
+        with open(path, 'rb') as fh:
+            return fh.read()
+    except OSError:
+        return None
+
+
+def _extract_job_id(project_id, video_index):
+    return f'{project_id}:{video_index}'
+
+
+def _extract_job_public(doc):
+    return {
+        'videoIndex': int(doc.get('video_index', 0)),
+        'status': doc.get('status'),
+        'done': int(doc.get('done') or 0),
+        'total': int(doc.get('total') or 0),
+        'error': doc.get('error'),
+        'startedAt': doc.get('started_at').isoformat() if doc.get('started_at') else None,
+        'finishedAt': doc.get('finished_at').isoformat() if doc.get('finished_at') else None,
+    }
+
+
+def _claim_extract_job(project_id, video_index, info):
+    """Mark the job running unless another worker holds a fresh claim on it."""
+    now = datetime.datetime.utcnow()
+    stale = now - datetime.timedelta(seconds=_EXTRACT_STALE_SECONDS)
+    try:
+        mongo.db.extract_jobs.update_one(
+            {
+                '_id': _extract_job_id(project_id, video_index),
+                '$or': [{'status': {'$ne': 'running'}}, {'updated_at': {'$lt': stale}}],
+            },
+            {
+                '$set': {
+                    'project_id': project_id,
+                    'video_index': video_index,
+                    'video_path': info['video_path'],
+                    'status': 'running',
+                    'done': 0,
+                    'total': info['sampled_count'],
+                    'error': None,
+                    'started_at': now,
+                    'finished_at': None,
+                    'updated_at': now,
+                }
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def _iter_sampled_frames(video_path, step):
+    """Decode a video once, front to back, yielding (frame_num, frame) for every step-th frame.
+
+    Raises RuntimeError if the file cannot be opened.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        cap.release()
+        raise RuntimeError('Failed to open video')
+    try:
+        frame_num = 0
+        while True:
+            if frame_num % step:
+                # skipped frames only need to pass through the decoder
+                if not cap.grab():
+                    break
+            else:
+                ok, frame = cap.read()
+                if not ok or frame is None:
+                    break
+                yield frame_num, frame
+            frame_num += 1
+            _yield_to_requests()
+    finally:
+        cap.release()
+
+
+def _write_atomic(path, data):
+    """Write-then-rename so readers in other workers never see a partial file."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+
+def _run_extract_job(job_id, info):
+    """Decode the whole video sequentially and store every sampled frame."""
+    store_dir = _frame_store_dir(info)
+    done = 0
+    last_report = time.monotonic()
+
+    def report(**fields):
+        fields['updated_at'] = datetime.datetime.utcnow()
+        mongo.db.extract_jobs.update_one({'_id': job_id}, {'$set': fields})
+
+    try:
+        os.makedirs(store_dir, exist_ok=True)
+        for frame_num, frame in _iter_sampled_frames(info['video_path'], info['step']):
+            path = os.path.join(store_dir, f'{frame_num:08d}.jpg')
+            if not os.path.exists(path):
+                ok, buf = cv2.imencode('.jpg', frame)
+                if ok:
+                    _write_atomic(path, buf.tobytes())
+            done += 1
+            if time.monotonic() - last_report >= 1.0:
+                report(done=done)
+                last_report = time.monotonic()
+        report(status='done', done=done, finished_at=datetime.datetime.utcnow())
+    except Exception as e:
+        app.logger.exception('frame extraction failed for %s', info['video_path'])
+        report(status='failed', done=done, error=str(e), finished_at=datetime.datetime.utcnow())
+
+
+@app.route('/api/projects/<project_id>/video_info', methods=['GET'])
+@token_required
+def get_video_info(current_user, project_id):
+    project = _cached_project(project_id)
+    if not project or project.get('user_id') != str(current_user['_id']):
+        return jsonify({"error": "Project not found or unauthorized"}), 404
+
+    vi = request.args.get('video_index', default=0, type=int)
+    info, err = _video_info_for(project, vi)
     if err:
         msg, code = err
         return jsonify({"error": msg}), code
 
-    step = info['step']
-    total_frames = info['total_frames']
-    frame_num = min(sample_index * step, max(0, total_frames - 1))
+    return jsonify({
+        'raw_fps': info['raw_fps'],
+        'total_frames': info['total_frames'],
+        'target_fps': info['target_fps'],
+        'step': info['step'],
+        'sampled_count': info['sampled_count'],
+        'width': info['width'],
+        'height': info['height']
+    })
 
-    cap = cv2.VideoCapture(info['video_path'])
-    if not cap.isOpened():
-        return jsonify({"error": "Failed to open video"}), 500
 
-    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
-    ok, frame = cap.read()
-    cap.release()
-    if not ok or frame is None:
-        return jsonify({"error": "Failed to read frame"}), 500
+@app.route('/api/projects/<project_id>/frame', methods=['GET'])
+@token_required
+def get_frame(current_user, project_id):
+    """One sampled frame. Optional ?width/?height (resized with area interpolation),
+    ?quality, ?format=jpeg|webp|png and ?crop=x,y,w,h (normalized ROI) select a variant.
+    """
+    project = _cached_project(project_id)
+    if not project or project.get('user_id') != str(current_user['_id']):
+        return jsonify({"error": "Project not found or unauthorized"}), 404
+
+    video_index = request.args.get('video_index', default=0, type=int)
+    sample_index = request.args.get('sample_index', default=0, type=int)
+
+    info, err = _video_info_for(project, video_index)
+    if err:
+        msg, code = err
+        return jsonify({"error": msg}), code
+
+    spec, err = _render_spec_from_args(request.args)
+    if err:
+        msg, code = err
+        return jsonify({"error": msg}), code
 
-    ok, buf = cv2.imencode('.jpg', frame)
-    if not ok:
-        return jsonify({"error": "Failed to encode frame"}), 500
+    step = info['step']
+    frame_num = _sample_frame_num(info, sample_index)
 
-    data = buf.tobytes()
-    return Response(data, mimetype='image/jpeg', headers={
+    headers = {
         'X-Frame-Step': str(step),
-        'X-Sampled-Count': str(info['sampled_count'])
+        'X-Sampled-Count': str(info['sampled_count']),
+        # the URL does not pin the project's fps/views or the file: always revalidate,
+        # which costs one 304 since the ETag is checked before any decode
+        'Cache-Control': 'private, no-cache',
+    }
+    ahead = request.args.get('prefetch', default=app.config['FRAME_PREFETCH_AHEAD'], type=int)
+    # client-supplied: the candidate list is built before the per-user cap applies
+    ahead = max(0, min(ahead, app.config['FRAME_PREFETCH_MAX']))
+    behind = min(app.config['FRAME_PREFETCH_BEHIND'], app.config['FRAME_PREFETCH_MAX']) if ahead > 0 else 0
+    user_id = str(current_user['_id'])
+
+    # the key is derived from file identity, so a matching ETag needs no decode at all
+    etag = _frame_cache_key(info, frame_num, spec)
+    if etag in request.if_none_match:
+        _prefetch_window(user_id, info, sample_index, ahead, behind, spec)
+        return Response(status=304, headers=dict(headers, ETag=f'"{etag}"'))
+
+    data, etag, err = _encoded_frame(info, frame_num, spec, user_id)
+    if err:
+        msg, code = err
+        if code == 503:
+            return jsonify({"error": msg}), code, {'Retry-After': '1'}
+        return jsonify({"error": msg}), code
+    _prefetch_window(user_id, info, sample_index, ahead, behind, spec)
+
+    headers['ETag'] = f'"{etag}"'
+    return Response(data, mimetype=_RENDER_MIMETYPES[spec[0]], headers=headers)
+
+
+_batch_executor = ThreadPoolExecutor(max_workers=max(1, app.config['BATCH_DECODE_WORKERS']),
+                                     thread_name_prefix='batch-decode')
+
+
+def _pack_frames(entries):
+    """Pack frames as: 4-byte big-endian header length, JSON header, then frame bytes.
+
+    Each header entry carries `offset`/`length` into the payload that follows the
+    header (or an `error`), so a client can slice out every frame from one body.
+    """
+    table = []
+    chunks = []
+    offset = 0
+    for meta, data in entries:
+        item = dict(meta)
+        if data is not None:
+            item['offset'] = offset
+            item['length'] = len(data)
+            chunks.append(data)
+            offset += len(data)
+        table.append(item)
+    header = json.dumps({'frames': table}, separators=(',', ':')).encode('utf-8')
+    return b''.join([struct.pack('>I', len(header)), header] + chunks)
+
+
+@app.route('/api/projects/<project_id>/frames', methods=['GET', 'POST'])
+@token_required
+def get_frames_batch(current_user, project_id):
+    """Fetch several frames in one round trip.
+
+    GET ?sample_index=N[&video_indices=0,2] returns that sample for all (or the listed)
+    views. POST {"frames": [{"video_index": v, "sample_index": s}, ...]} returns an
+    arbitrary set. Frames are decoded in parallel and packed by _pack_frames; the
+    /frame rendering parameters (width, height, quality, format, crop) apply to all.
+    """
+    project = _cached_project(project_id)
+    if not project or project.get('user_id') != str(current_user['_id']):
+        return jsonify({"error": "Project not found or unauthorized"}), 404
+
+    pairs = []
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        items = body.get('frames') if isinstance(body, dict) else None
+        if not isinstance(items, list):
+            return jsonify({"error": "Body must be {\"frames\": [{video_index, sample_index}, ...]}"}), 400
+        for item in items:
+            try:
+                pairs.append((int(item.get('video_index')), int(item.get('sample_index'))))
+            except Exception:
+                return jsonify({"error": "Each frame needs integer video_index and sample_index"}), 400
+    else:
+        sample_index = request.args.get('sample_index', type=int)
+        if sample_index is None:
+            return jsonify({"error": "sample_index is required"}), 400
+        raw = request.args.get('video_indices')
+        if raw:
+            try:
+                views = [int(x) for x in raw.split(',') if x.strip()]
+            except ValueError:
+                return jsonify({"error": "video_indices must be comma-separated integers"}), 400
+        else:
+            views = range(len(project.get('selected_videos') or []))
+        pairs = [(vi, sample_index) for vi in views]
+
+    if not pairs:
+        return jsonify({"error": "No frames requested"}), 400
+    spec, err = _render_spec_from_args(request.args)
+    if err:
+        msg, code = err
+        return jsonify({"error": msg}), code
+    if len(pairs) > app.config['BATCH_MAX_FRAMES']:
+        return jsonify({"error": f"At most {app.config['BATCH_MAX_FRAMES']} frames per request"}), 400
+
+    user_id = str(current_user['_id'])
+    infos = {}
+    for vi, _ in pairs:
+        if vi not in infos:
+            infos[vi] = _video_info_for(project, vi)
+
+    def render(pair):
+        vi, si = pair
+        meta = {'video_index': vi, 'sample_index': si}
+        info, err = infos[vi]
+        if err:
+            meta['error'] = err[0]
+            return meta, None
+        frame_num = _sample_frame_num(info, si)
+        meta.update({'frame_num': frame_num, 'step': info['step'],
+                     'sampled_count': info['sampled_count']})
+        data, key, err = _encoded_frame(info, frame_num, spec, user_id, admitted=True)
+        if err:
+            meta['error'] = err[0]
+            return meta, None
+        meta['etag'] = key
+        meta['mimetype'] = _RENDER_MIMETYPES[spec[0]]
+        return meta, data
+
+    # one admission for the whole batch: its frames must not crowd each other out
+    with decode_pool.admission(user_id) as admitted:
+        if not admitted:
+            return jsonify({"error": "Frame decoder is busy"}), 503, {'Retry-After': '1'}
+        entries = list(_batch_executor.map(render, pairs))
+    return Response(_pack_frames(entries), mimetype='application/x-labelmv-frames', headers={
+        'Cache-Control': 'private, no-store',
     })
 
 
+@app.route('/api/frame_cache/stats', methods=['GET'])
+@token_required
+def get_frame_cache_stats(current_user):
+    """Hit/miss/eviction counters of this worker's frame cache."""
+    return jsonify(frame_cache.stats())
+
+
+@app.route('/api/projects/<project_id>/extract', methods=['POST'])
+@token_required
+def start_frame_extraction(current_user, project_id):
+    """Start background pre-extraction of sampled frames for one or all project videos."""
+    project = _cached_project(project_id)
+    if not project or project.get('user_id') != str(current_user['_id']):
+        return jsonify({"error": "Project not found or unauthorized"}), 404
+
+    video_index = request.args.get('video_index', type=int)
+    if video_index is None:
+        indices = range(len(project.get('selected_videos') or []))
+    else:
+        indices = [video_index]
+
+    pid = str(project['_id'])
+    started = []
+    for vi in indices:
+        info, err = _video_info_for(project, vi)
+        if err:
+            msg, code = err
+            return jsonify({"error": msg, "videoIndex": vi}), code
+        if _claim_extract_job(pid, vi, info):
+            _extract_executor.submit(_run_extract_job, _extract_job_id(pid, vi), info)
+            started.append(vi)
+
+    jobs = mongo.db.extract_jobs.find({'project_id': pid}, {'video_path': 0}).sort('video_index', 1)
+    return jsonify({
+        'started': started,
+        'jobs': [_extract_job_public(j) for j in jobs],
+    }), 202
+
+
+@app.route('/api/projects/<project_id>/extract', methods=['GET'])
+@token_required
+def get_frame_extraction(current_user, project_id):
+    """Report pre-extraction progress for every video of the project."""
+    project = _cached_project(project_id)
+    if not project or project.get('user_id') != str(current_user['_id']):
+        return jsonify({"error": "Project not found or unauthorized"}), 404
+
+    jobs = mongo.db.extract_jobs.find({'project_id': str(project['_id'])}, {'video_path': 0}).sort('video_index', 1)
+    return jsonify([_extract_job_public(j) for j in jobs])
+
+
+# -------- Source video streaming --------
+
+_BUILD_STALE_SECONDS = 3600
+# a failed build is reported as such, not retried, for this long
+_BUILD_RETRY_SECONDS = 600
+
+
+def _proxy_path(info):
+    raw = '|'.join([info['video_path'], repr(info['mtime']), str(info['size']),
+                    str(app.config['PROXY_HEIGHT'])])
+    return os.path.join(app.config['PROXY_DIR'], hashlib.sha1(raw.encode('utf-8')).hexdigest() + '.webm')
+
+
+def _claim_build(path):
+    """Create `path`.part exclusively; the caller then owns generating `path`.
+
+    Used for proxy renditions and sprite directories, shared by all workers.
+    """
+    part = path + '.part'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        if time.time() - os.path.getmtime(part) > _BUILD_STALE_SECONDS:
+            os.remove(part)  # left behind by a worker that died mid-encode
+    except OSError:
+        pass
+    try:
+        os.close(os.open(part, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return False
+    return True
+
+
+def _record_build_failure(path, error):
+    """Leave `path`.failed so requests report the error instead of rebuilding at once."""
+    try:
+        _write_atomic(path + '.failed', json.dumps({'error': str(error), 'at': time.time()}).encode('utf-8'))
+    except OSError as e:
+        app.logger.warning('could not record build failure for %s: %s', path, e)
+
+
+def _build_failure(path):
+    """The error of a recent failed build of `path`, or None once it may be retried."""
+    marker = path + '.failed'
+    try:
+        with open(marker, 'rb') as fh:
+            failure = json.loads(fh.read().decode('utf-8'))
+    except (OSError, ValueError):
+        return None
+    if time.time() - float(failure.get('at') or 0) < _BUILD_RETRY_SECONDS:
+        return failure.get('error') or 'unknown error'
+    try:
+        os.remove(marker)
+    except OSError:
+        pass
+    return None
+
+
+def _build_proxy(info, path):
+    """Transcode to a downscaled VP8 WebM at the source frame rate, sequentially."""
+    part = path + '.part'
+    tmp = path + '.tmp.webm'
+    try:
+        cap = cv2.VideoCapture(info['video_path'])
+        writer = None
+        try:
+            while True:
+                ok, frame = cap.read()
+                if not ok or frame is None:
+                    break
+                h, w = frame.shape[:2]
+                target_h = min(h, app.config['PROXY_HEIGHT'])
+                target_w = max(2, int(round(w * target_h / float(h))) // 2 * 2)
+                if writer is None:
+                    writer = cv2.VideoWriter(tmp, cv2.VideoWriter_fourcc(*'VP80'),
+                                             info['raw_fps'], (target_w, target_h))
+                    if not writer.isOpened():
+                        raise RuntimeError('VP8 encoder is not available')
+                if (target_w, target_h) != (w, h):
+                    frame = cv2.resize(frame, (target_w, target_h), interpolation=cv2.INTER_AREA)
+                writer.write(frame)
+                _yield_to_requests()
+        finally:
+            cap.release()
+            if writer is not None:
+                writer.release()
+        if writer is None:
+            raise RuntimeError('No frames decoded')
+        os.replace(tmp, path)
+    except Exception as e:
+        app.logger.exception('proxy generation failed for %s', info['video_path'])
+        _record_build_failure(path, e)
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+    finally:
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+
+
+@app.route('/api/projects/<project_id>/video', methods=['GET'])
+@media_token_required
+def stream_video(current_user, project_id):
+    """Serve a project's source video with Range/206 and conditional request support.
+
+    ?proxy=1 serves a downscaled WebM rendition instead, generating it in the
+    background on first request (202 until it is ready; 500 for a while after a
+    failed transcode, which is then retried). Accepts ?access_token= so
+    the URL can be used directly as a <video> source.
+    """
+    project = _cached_project(project_id)
+    if not project or project.get('user_id') != str(current_user['_id']):
+        return jsonify({"error": "Project not found or unauthorized"}), 404
+
+    video_index = request.args.get('video_index', default=0, type=int)
+    info, err = _video_info_for(project, video_index)
+    if err:
+        msg, code = err
+        return jsonify({"error": msg}), code
+
+    path = info['video_path']
+    if request.args.get('proxy') in ('1', 'true'):
+        path = _proxy_path(info)
+        if not os.path.isfile(path):
+            failure = _build_failure(path)
+            if failure:
+                return jsonify({"error": f"Proxy generation failed: {failure}"}), 500
+            if _claim_build(path):
+                _extract_executor.submit(_build_proxy, info, path)
+            return jsonify({"status": "generating"}), 202
+
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    # conditional=True handles Range/206, If-Range, ETag and If-Modified-Since;
+    # gunicorn serves full-file bodies through os.sendfile via wsgi.file_wrapper
+    resp = send_file(path, mimetype=mimetype, conditional=True, etag=True,
+                     max_age=app.config['VIDEO_MAX_AGE'])
+    resp.headers['Accept-Ranges'] = 'bytes'
+    resp.cache_control.public = False
+    resp.cache_control.private = True
+    return resp
+
+
+# -------- Timeline thumbnail sprites --------
+#
+# One sequential pass over the sampled frames produces sheets of columns x rows
+# downscaled tiles plus index.json. Everything lives in a directory keyed on the
+# video identity, step and tile layout, so a changed file or fps gets fresh sprites.
+
+def _sprite_layout(info):
+    tile_w = max(16, app.config['SPRITE_TILE_WIDTH'])
+    src_w = info['width'] or 16
+    src_h = info['height'] or 9
+    tile_h = max(1, int(round(tile_w * src_h / float(src_w))))
+    return tile_w, tile_h, max(1, app.config['SPRITE_COLUMNS']), max(1, app.config['SPRITE_ROWS'])
+
+
+def _sprite_dir(info):
+    raw = '|'.join([info['video_path'], repr(info['mtime']), str(info['size']),
+                    str(info['step']), repr(_sprite_layout(info))])
+    return os.path.join(app.config['SPRITE_DIR'], hashlib.sha1(raw.encode('utf-8')).hexdigest())
+
+
+def _build_sprites(info, out_dir):
+    tile_w, tile_h, cols, rows = _sprite_layout(info)
+    per_sheet = cols * rows
+    part = out_dir + '.part'
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+        sheet = None
+        sheet_no = 0
+        tiles = []
+
+        def flush(sheet, sheet_no):
+            ok, buf = cv2.imencode('.jpg', sheet, [cv2.IMWRITE_JPEG_QUALITY, 80])
+            if not ok:
+                raise RuntimeError('Failed to encode sprite sheet')
+            _write_atomic(os.path.join(out_dir, f'{sheet_no}.jpg'), buf.tobytes())
+
+        for _, frame in _iter_sampled_frames(info['video_path'], info['step']):
+            slot = len(tiles) % per_sheet
+            if slot == 0:
+                if sheet is not None:
+                    flush(sheet, sheet_no)
+                    sheet_no += 1
+                sheet = np.zeros((rows * tile_h, cols * tile_w, 3), np.uint8)
+            x, y = (slot % cols) * tile_w, (slot // cols) * tile_h
+            sheet[y:y + tile_h, x:x + tile_w] = cv2.resize(
+                frame, (tile_w, tile_h), interpolation=cv2.INTER_AREA)
+            tiles.append([sheet_no, x, y])
+        if sheet is not None:
+            flush(sheet, sheet_no)
+
+        index = {
+            'tile_width': tile_w,
+            'tile_height': tile_h,
+            'columns': cols,
+            'rows': rows,
+            'sheets': sheet_no + 1 if tiles else 0,
+            # tiles[sample_index] = [sheet, x, y]
+            'tiles': tiles,
+        }
+        # index.json last: its presence marks the sprites complete
+        _write_atomic(os.path.join(out_dir, 'index.json'), json.dumps(index).encode('utf-8'))
+    except Exception as e:
+        app.logger.exception('sprite generation failed for %s', info['video_path'])
+        _record_build_failure(out_dir, e)
+    finally:
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+
+
+def _sprites_or_schedule(project, video_index):
+    """Return (info, sprite_dir, ready, error), starting background generation if needed."""
+    info, err = _video_info_for(project, video_index)
+    if err:
+        return None, None, False, err
+    out_dir = _sprite_dir(info)
+    if os.path.isfile(os.path.join(out_dir, 'index.json')):
+        return info, out_dir, True, None
+    failure = _build_failure(out_dir)
+    if failure:
+        return info, out_dir, False, (f"Sprite generation failed: {failure}", 500)
+    if _claim_build(out_dir):
+        _extract_executor.submit(_build_sprites, info, out_dir)
+    return info, out_dir, False, None
+
+
+@app.route('/api/projects/<project_id>/sprites', methods=['GET'])
+@token_required
+def get_sprite_index(current_user, project_id):
+    """Sprite index for one view: layout plus tiles[sample_index] = [sheet, x, y].
+
+    202 while the sprites are still being generated; 500 for a while after a failed
+    build, which is then retried.
+    """
+    project = _cached_project(project_id)
+    if not project or project.get('user_id') != str(current_user['_id']):
+        return jsonify({"error": "Project not found or unauthorized"}), 404
+
+    video_index = request.args.get('video_index', default=0, type=int)
+    info, out_dir, ready, err = _sprites_or_schedule(project, video_index)
+    if err:
+        msg, code = err
+        return jsonify({"error": msg}), code
+    if not ready:
+        return jsonify({"status": "generating"}), 202
+
+    resp = send_file(os.path.join(out_dir, 'index.json'), mimetype='application/json',
+                     conditional=True, etag=True)
+    # a project update changes the sprites behind the same URL; revalidate every time
+    resp.cache_control.public = False
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp
+
+
+@app.route('/api/projects/<project_id>/sprites/<int:sheet>.jpg', methods=['GET'])
+@media_token_required
+def get_sprite_sheet(current_user, project_id, sheet):
+    """One sprite sheet image. Accepts ?access_token= for use in <img>/CSS URLs."""
+    project = _cached_project(project_id)
+    if not project or project.get('user_id') != str(current_user['_id']):
+        return jsonify({"error": "Project not found or unauthorized"}), 404
+
+    video_index = request.args.get('video_index', default=0, type=int)
+    info, out_dir, ready, err = _sprites_or_schedule(project, video_index)
+    if err:
+        msg, code = err
+        return jsonify({"error": msg}), code
+    if not ready:
+        return jsonify({"status": "generating"}), 202
+
+    path = os.path.join(out_dir, f'{sheet}.jpg')
+    if not os.path.isfile(path):
+        return jsonify({"error": "Sprite sheet not found"}), 404
+    resp = send_file(path, mimetype='image/jpeg', conditional=True, etag=True)
+    resp.cache_control.public = False
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp
+
+
+# -------- Training dataset export --------
+#
+# Annotated frames plus labels in MOT-style text (FR-24), COCO JSON or YOLO txt,
+# packed into a tar or zip under DATASET_EXPORT_DIR by a background job. Each
+# video is decoded once, front to back, by decode_worker.extract_frames in a
+# process pool (one video per task); the job thread moves the JPEGs into the
+# archive as they land in a scratch directory and records progress in
+# `dataset_exports`. No request is held open while this runs, so a sync worker's
+# timeout never cuts an export short; the finished archive is then downloaded
+# from /dataset/<job_id>?download=1.
+
+_DATASET_FORMATS = ('mot', 'coco', 'yolo')
+# finished archives are kept as long as their progress doc (the `expire` TTL index)
+_DATASET_ARCHIVE_MAX_AGE = 7 * 24 * 3600
+_dataset_pool_lock = threading.Lock()
+_dataset_pool = None
+_dataset_jobs = ThreadPoolExecutor(max_workers=2, thread_name_prefix='dataset-export')
+
+
+def _dataset_executor(reset=False):
+    global _dataset_pool
+    with _dataset_pool_lock:
+        if reset:
+            _dataset_pool = None
+        if _dataset_pool is None:
+            _dataset_pool = ProcessPoolExecutor(
+                max_workers=max(1, app.config['DATASET_EXPORT_WORKERS']),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=decode_worker.worker_init)
+        return _dataset_pool
+
+
+class _ArchiveWriter:
+    """A tar or zip file being filled member by member."""
+
+    def __init__(self, path, kind):
+        if kind == 'zip':
+            self._zip = zipfile.ZipFile(path, 'w', allowZip64=True)
+            self._tar = None
+        else:
+            self._zip = None
+            self._tar = tarfile.open(path, mode='w')
+
+    def add(self, name, data, compress=False):
+        if self._zip is not None:
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            # JPEGs do not shrink any further; labels do
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            self._zip.writestr(info, data)
+        else:
+            member = tarfile.TarInfo(name)
+            member.size = len(data)
+            member.mtime = int(time.time())
+            self._tar.addfile(member, io.BytesIO(data))
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+        else:
+            self._tar.close()
+
+
+def _view_name(video_index, video_name):
+    # the index keeps cam.mp4/cam.avi or a/x.mp4/b/x.mp4 apart
+    stem = os.path.splitext(video_name)[0].replace('/', '_').replace('\\', '_')
+    return f'{video_index:02d}_{stem}'
+
+
+def _box_pixels(box, width, height):
+    """(left, top, width, height) of a normalized box in source-video pixels."""
+    return (float(box.get('left') or 0) * width, float(box.get('top') or 0) * height,
+            float(box.get('width') or 0) * width, float(box.get('height') or 0) * height)
+
+
+def _mot_attributes(box):
+    attrs = box.get('attributes') or {}
+    if not isinstance(attrs, dict) or not attrs:
+        return '-'
+    # keep the comma-separated columns parseable
+    return ';'.join(f'{k}={str(v).replace(",", " ")}' for k, v in sorted(attrs.items()))
+
+
+def _dataset_labels(fmt, project, views):
+    """Label files as [(archive name, bytes)] for `views`.
+
+    `views` is a list of (video_index, view name, info, {frame_num: boxes}).
+    """
+    classes = [str(c) for c in (project.get('classes') or [])]
+    for _, _, _, frames in views:
+        for boxes in frames.values():
+            for box in boxes:
+                name = str(box.get('className') or '')
+                if name and name not in classes:
+                    classes.append(name)
+    class_ids = {name: i for i, name in enumerate(classes)}
+
+    if fmt == 'mot':
+        # FR-24: view, frame, id, object, attributes, left top width height (source pixels)
+        lines = []
+        for vi, _, info, frames in views:
+            for frame_num in sorted(frames):
+                for box in frames[frame_num]:
+                    l, t, w, h = _box_pixels(box, info['width'], info['height'])
+                    lines.append(f"{vi}, {frame_num}, {box.get('objectId', 0)}, "
+                                 f"{box.get('className') or ''}, {_mot_attributes(box)}, "
+                                 f"{l:.2f} {t:.2f} {w:.2f} {h:.2f}")
+        return [('labels.txt', ('\n'.join(lines) + '\n').encode('utf-8'))]
+
+    if fmt == 'yolo':
+        files = [('classes.txt', ('\n'.join(classes) + '\n').encode('utf-8'))]
+        for _, view, _, frames in views:
+            for frame_num in sorted(frames):
+                lines = []
+                for box in frames[frame_num]:
+                    bl, bt = float(box.get('left') or 0), float(box.get('top') or 0)
+                    bw, bh = float(box.get('width') or 0), float(box.get('height') or 0)
+                    cls = class_ids.get(str(box.get('className') or ''), 0)
+                    lines.append(f'{cls} {bl + bw / 2:.6f} {bt + bh / 2:.6f} {bw:.6f} {bh:.6f}')
+                files.append((f'labels/{view}/{frame_num:06d}.txt', ('\n'.join(lines) + '\n').encode('utf-8')))
+        return files
+
+    images, annotations = [], []
+    for vi, view, info, frames in views:
+        for frame_num in sorted(frames):
+            image_id = len(images) + 1
+            images.append({'id': image_id, 'file_name': f'images/{view}/{frame_num:06d}.jpg',
+                           'width': info['width'], 'height': info['height'],
+                           'video_index': vi, 'frame': frame_num})
+            for box in frames[frame_num]:
+                l, t, w, h = _box_pixels(box, info['width'], info['height'])
+                annotations.append({
+                    'id': len(annotations) + 1, 'image_id': image_id,
+                    'category_id': class_ids.get(str(box.get('className') or ''), 0) + 1,
+                    'bbox': [round(l, 2), round(t, 2), round(w, 2), round(h, 2)],
+                    'area': round(w * h, 2), 'iscrowd': 0,
+                    'track_id': box.get('objectId'), 'attributes': box.get('attributes') or {},
+                })
+    coco = {
+        'info': {'description': f"labelmv project {project['_id']}",
+                 'date_created': datetime.datetime.utcnow().isoformat() + 'Z'},
+        'images': images,
+        'annotations': annotations,
+        'categories': [{'id': i + 1, 'name': name} for i, name in enumerate(classes)],
+    }
+    return [('annotations.json', json.dumps(coco, ensure_ascii=False).encode('utf-8'))]
+
+
+def _dataset_export_public(doc):
+    out = {
+        'jobId': doc['_id'],
+        'status': doc.get('status'),
+        'format': doc.get('format'),
+        'archive': doc.get('archive'),
+        'done': int(doc.get('done') or 0),
+        'total': int(doc.get('total') or 0),
+        'videos': doc.get('videos') or [],
+        'size': doc.get('size'),
+        'error': doc.get('error'),
+        'startedAt': doc.get('started_at').isoformat() if doc.get('started_at') else None,
+        'finishedAt': doc.get('finished_at').isoformat() if doc.get('finished_at') else None,
+    }
+    if doc.get('status') == 'done':
+        out['downloadUrl'] = f"/api/projects/{doc['project_id']}/dataset/{doc['_id']}?download=1"
+    return out
+
+
+def _dataset_archive_path(job_id, kind):
+    return os.path.join(app.config['DATASET_EXPORT_DIR'], f'{job_id}.{kind}')
+
+
+def _prune_dataset_archives():
+    """Remove archives (and scratch left by a killed worker) older than their progress docs."""
+    root = app.config['DATASET_EXPORT_DIR']
+    cutoff = time.time() - _DATASET_ARCHIVE_MAX_AGE
+    try:
+        entries = list(os.scandir(root))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.stat(follow_symlinks=False).st_mtime >= cutoff:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+class _ExportCancelled(Exception):
+    pass
+
+
+def _run_dataset_export(job_id, project, fmt, kind, quality, views):
+    """Background job: decode, pack and label `views` into the job's archive file."""
+    scratch = os.path.join(app.config['DATASET_EXPORT_DIR'], job_id)
+    final = _dataset_archive_path(job_id, kind)
+    part = final + '.part'
+    pending = {}
+    done_by_video = {}
+
+    def progress(status=None, error=None, **extra):
+        update = dict(extra, updated_at=datetime.datetime.utcnow(), done=sum(done_by_video.values()),
+                      videos=[{'videoIndex': vi, 'done': done_by_video.get(vi, 0), 'total': len(frames)}
+                              for vi, _, _, frames in views])
+        if status:
+            update['status'] = status
+            if status != 'running':
+                update['finished_at'] = update['updated_at']
+        if error:
+            update['error'] = error
+        # a DELETE may have cancelled the job meanwhile; never overwrite that
+        res = mongo.db.dataset_exports.update_one({'_id': job_id, 'status': {'$ne': 'cancelled'}},
+                                                  {'$set': update})
+        if not res.matched_count:
+            raise _ExportCancelled()
+
+    try:
+        progress('running', started_at=datetime.datetime.utcnow())
+        os.makedirs(scratch, exist_ok=True)
+        archive = _ArchiveWriter(part, kind)
+        try:
+            executor = _dataset_executor()
+            for vi, view, info, frames in views:
+                out_dir = os.path.join(scratch, view)
+                os.makedirs(out_dir, exist_ok=True)
+                try:
+                    fut = executor.submit(decode_worker.extract_frames, info['video_path'],
+                                          sorted(frames), out_dir, quality)
+                except BrokenProcessPool:
+                    executor = _dataset_executor(reset=True)
+                    fut = executor.submit(decode_worker.extract_frames, info['video_path'],
+                                          sorted(frames), out_dir, quality)
+                pending[fut] = (vi, view, out_dir)
+
+            errors = []
+            last_report = time.monotonic()
+            while pending:
+                completed, _ = wait(list(pending), timeout=0.5, return_when=FIRST_COMPLETED)
+                for fut, (vi, view, out_dir) in list(pending.items()):
+                    # a .jpg in the scratch dir is complete (the worker renames into place)
+                    for name in sorted(os.listdir(out_dir)):
+                        if not name.endswith('.jpg'):
+                            continue
+                        path = os.path.join(out_dir, name)
+                        with open(path, 'rb') as fh:
+                            archive.add(f'images/{view}/{name}', fh.read())
+                        os.remove(path)
+                        done_by_video[vi] = done_by_video.get(vi, 0) + 1
+                    if fut in completed:
+                        del pending[fut]
+                        if fut.exception() is not None:
+                            errors.append(f'video {vi}: {fut.exception()}')
+                if time.monotonic() - last_report > 1.0:
+                    last_report = time.monotonic()
+                    progress()
+
+            for name, data in _dataset_labels(fmt, project, views):
+                archive.add(name, data, compress=True)
+            if errors:
+                archive.add('errors.txt', ('\n'.join(errors) + '\n').encode('utf-8'), compress=True)
+        finally:
+            archive.close()
+        os.replace(part, final)
+        progress('done' if not errors else 'failed', '; '.join(errors) or None,
+                 size=os.path.getsize(final))
+    except _ExportCancelled:
+        pass
+    except Exception as e:
+        app.logger.exception('dataset export %s failed', job_id)
+        try:
+            progress('failed', str(e))
+        except Exception:
+            pass
+    finally:
+        for fut in pending:
+            fut.cancel()
+        shutil.rmtree(scratch, ignore_errors=True)
+        if os.path.exists(part):
+            os.remove(part)
+        doc = mongo.db.dataset_exports.find_one({'_id': job_id}, {'status': 1})
+        if doc and doc.get('status') == 'cancelled' and os.path.exists(final):
+            os.remove(final)
+
+
+@app.route('/api/projects/<project_id>/dataset', methods=['POST'])
+@token_required
+def export_dataset(current_user, project_id):
+    """Start building a training set of annotated frames and labels.
+
+    Body (all optional): {"format": "mot"|"coco"|"yolo", "archive": "tar"|"zip",
+    "video_index": V, "quality": 1..100}. Answers 202 with the job; poll
+    /dataset/<job_id> and download from its `downloadUrl` once status is "done".
+    """
+    project = _cached_project(project_id)
+    if not project or project.get('user_id') != str(current_user['_id']):
+        return jsonify({"error": "Project not found or unauthorized"}), 404
+
+    body = request.get_json(silent=True) or {}
+    fmt = body.get('format', 'mot')
+    if fmt not in _DATASET_FORMATS:
+        return jsonify({"error": "format must be mot, coco or yolo"}), 400
+    kind = body.get('archive', 'tar')
+    if kind not in ('tar', 'zip'):
+        return jsonify({"error": "archive must be tar or zip"}), 400
+    quality = body.get('quality', 95)
+    if not isinstance(quality, int):
+        return jsonify({"error": "quality must be an integer"}), 400
+    quality = max(1, min(quality, 100))
+    video_index = body.get('video_index')
+    names = project.get('selected_videos') or []
+    if video_index is not None and (not isinstance(video_index, int) or not 0 <= video_index < len(names)):
+        return jsonify({"error": "Invalid video_index"}), 400
+    indices = range(len(names)) if video_index is None else [video_index]
+
+    filt = {'user_id': str(current_user['_id']), 'project_id': str(project['_id']),
+            'boxes.0': {'$exists': True}}
+    if video_index is not None:
+        filt['video_index'] = video_index
+    by_video = {}
+    for doc in mongo.db.annotations.find(filt, {'_id': 0, 'video_index': 1, 'sample_index': 1, 'boxes': 1}):
+        by_video.setdefault(int(doc['video_index']), {})[int(doc['sample_index'])] = doc['boxes']
+
+    views = []
+    for vi in indices:
+        info, err = _video_info_for(project, vi)
+        if err:
+            msg, code = err
+            return jsonify({"error": f"video {vi}: {msg}"}), code
+        frames = {}
+        for si, boxes in (by_video.get(vi) or {}).items():
+            if 0 <= si < info['sampled_count']:
+                frames.setdefault(_sample_frame_num(info, si), []).extend(boxes)
+        if frames:
+            views.append((vi, _view_name(vi, names[vi]), info, frames))
+
+    _prune_dataset_archives()
+    job_id = uuid.uuid4().hex
+    now = datetime.datetime.utcnow()
+    doc = {
+        '_id': job_id,
+        'user_id': str(current_user['_id']),
+        'project_id': str(project['_id']),
+        'format': fmt,
+        'archive': kind,
+        'status': 'queued',
+        'done': 0,
+        'total': sum(len(frames) for _, _, _, frames in views),
+        'videos': [{'videoIndex': vi, 'done': 0, 'total': len(frames)} for vi, _, _, frames in views],
+        'size': None,
+        'error': None,
+        'started_at': None,
+        'finished_at': None,
+        'updated_at': now,
+    }
+    mongo.db.dataset_exports.insert_one(doc)
+    _dataset_jobs.submit(_run_dataset_export, job_id, project, fmt, kind, quality, views)
+    return jsonify(_dataset_export_public(doc)), 202
+
+
+@app.route('/api/projects/<project_id>/dataset/<job_id>', methods=['GET', 'DELETE'])
+@media_token_required
+def get_dataset_export(current_user, project_id, job_id):
+    """Progress of a dataset export; ?download=1 serves the finished archive, DELETE cancels."""
+    doc = mongo.db.dataset_exports.find_one({'_id': job_id, 'project_id': project_id,
+                                             'user_id': str(current_user['_id'])})
+    if not doc:
+        return jsonify({"error": "Export not found"}), 404
+
+    if request.method == 'DELETE':
+        if doc.get('status') in ('queued', 'running', 'done'):
+            now = datetime.datetime.utcnow()
+            doc = mongo.db.dataset_exports.find_one_and_update(
+                {'_id': job_id}, {'$set': {'status': 'cancelled', 'finished_at': now, 'updated_at': now}},
+                return_document=ReturnDocument.AFTER)
+            path = _dataset_archive_path(job_id, doc.get('archive') or 'tar')
+            if os.path.exists(path):
+                os.remove(path)
+        return jsonify(_dataset_export_public(doc))
+
+    if request.args.get('download') not in ('1', 'true'):
+        return jsonify(_dataset_export_public(doc))
+    if doc.get('status') != 'done':
+        return jsonify({"error": "Export is not finished", "status": doc.get('status')}), 409
+    kind = doc.get('archive') or 'tar'
+    path = _dataset_archive_path(job_id, kind)
+    if not os.path.isfile(path):
+        return jsonify({"error": "Export archive has expired"}), 410
+    # conditional=True gives Range/206, so an interrupted download can resume
+    resp = send_file(path, mimetype='application/zip' if kind == 'zip' else 'application/x-tar',
+                     as_attachment=True, download_name=f"dataset_{doc.get('format')}_{project_id}.{kind}",
+                     conditional=True, etag=True, max_age=0)
+    resp.headers['Accept-Ranges'] = 'bytes'
+    resp.cache_control.public = False
+    resp.cache_control.private = True
+    return resp
+
+
 # -------- Per-frame Annotations (project/video/sample specific) --------
 
 @app.route('/api/projects/<project_id>/annotations', methods=['GET'])
 @token_required
 def get_frame_annotations(current_user, project_id):
-    try:
-        project = mongo.db.projects.find_one({'_id': ObjectId(project_id)})
-    except Exception:
-        project = None
+    project = _cached_project(project_id)
     if not project or project.get('user_id') != str(current_user['_id']):
         return jsonify({"error": "Project not found or unauthorized"}), 404
 
@@ -619,18 +3243,166 @@ def get_frame_annotations(current_user, project_id):
         'project_id': str(project['_id']),
         'video_index': int(video_index),
         'sample_index': int(sample_index),
-    })
+    }, {'_id': 0, 'boxes': 1, 'version': 1})
+    version = str(int((doc or {}).get('version') or 0))
+    # every write bumps `version`, so it identifies the frame's boxes exactly
+    headers = {'X-Annotation-Version': version, 'ETag': f'"a{version}"',
+               'Cache-Control': 'private, no-cache'}
+    if f'a{version}' in request.if_none_match:
+        return Response(status=304, headers=headers)
     boxes = doc.get('boxes') if doc else []
-    return jsonify(boxes)
+    return jsonify(boxes), 200, headers
+
+
+@app.route('/api/projects/<project_id>/annotations/range', methods=['GET'])
+@token_required
+def get_range_annotations(current_user, project_id):
+    """Boxes for a window of samples in one cursor.
+
+    ?video_index=V limits to one view (all views otherwise); ?start=S&end=E bounds the
+    sample window, inclusive (whole view otherwise). The response is keyed by view,
+    then sample: {"0": {"12": [...boxes], ...}, ...}. Samples with no saved doc are
+    omitted, which the client treats the same as an empty frame.
+    """
+    project = _cached_project(project_id)
+    if not project or project.get('user_id') != str(current_user['_id']):
+        return jsonify({"error": "Project not found or unauthorized"}), 404
+
+    video_index = request.args.get('video_index', type=int)
+    start = request.args.get('start', type=int)
+    end = request.args.get('end', type=int)
+    if start is not None and end is not None and end < start:
+        return jsonify({"error": "end must be >= start"}), 400
+
+    query = {
+        'user_id': str(current_user['_id']),
+        'project_id': str(project['_id']),
+    }
+    if video_index is not None:
+        query['video_index'] = int(video_index)
+    window = {}
+    if start is not None:
+        window['$gte'] = int(start)
+    if end is not None:
+        window['$lte'] = int(end)
+    if window:
+        query['sample_index'] = window
+
+    # docs are never deleted individually and every write bumps one doc's version,
+    # so (doc count, version sum) changes whenever anything in the window does
+    summary = next(mongo.db.annotations.aggregate([
+        {'$match': query},
+        {'$group': {'_id': None, 'n': {'$sum': 1}, 'v': {'$sum': {'$ifNull': ['$version', 0]}}}},
+    ]), None) or {'n': 0, 'v': 0}
+    etag = f"r{summary['n']}-{summary['v']}"
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'}
+    if etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+
+    cursor = mongo.db.annotations.find(
+        query, {'_id': 0, 'video_index': 1, 'sample_index': 1, 'boxes': 1}
+    ).sort([('video_index', 1), ('sample_index', 1)])
+
+    result = {}
+    for doc in cursor:
+        view = result.setdefault(str(int(doc.get('video_index', 0))), {})
+        view[str(int(doc.get('sample_index', 0)))] = doc.get('boxes') or []
+    return jsonify(result), 200, headers
+
+
+def _parse_change_cursor(value):
+    """'<updated_at ms>.<video_index>.<sample_index>' -> (datetime, vi, si)."""
+    try:
+        ms, vi, si = (int(p) for p in value.split('.'))
+    except (AttributeError, ValueError):
+        raise ValueError('Invalid cursor')
+    return datetime.datetime(1970, 1, 1) + datetime.timedelta(milliseconds=ms), vi, si
+
+
+def _change_cursor(ts, vi, si):
+    ms = (ts - datetime.datetime(1970, 1, 1)) // datetime.timedelta(milliseconds=1)
+    return f'{ms}.{vi}.{si}'
+
+
+@app.route('/api/projects/<project_id>/annotations/changes', methods=['GET'])
+@token_required
+def get_annotation_changes(current_user, project_id):
+    """Frames written after `since`, oldest first, for incremental sync.
+
+    ?since=<cursor> (omit for everything), ?video_index=V, ?limit=N. Returns
+    {"changes": [{"videoIndex", "sampleIndex", "version", "updatedAt", "boxes"}],
+    "cursor": ..., "more": bool}; pass `cursor` back as `since` on the next call.
+    Writes younger than CHANGE_FEED_SETTLE seconds are held back so a save that
+    committed late with an earlier timestamp is not skipped.
+    """
+    project = _cached_project(project_id)
+    if not project or project.get('user_id') != str(current_user['_id']):
+        return jsonify({"error": "Project not found or unauthorized"}), 404
+
+    limit = request.args.get('limit', app.config['CHANGE_FEED_LIMIT'], type=int)
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+    limit = min(limit, app.config['CHANGE_FEED_LIMIT'])
+
+    # Mongo keeps milliseconds; truncate so the horizon compares like stored values
+    horizon = datetime.datetime.utcnow() - datetime.timedelta(seconds=app.config['CHANGE_FEED_SETTLE'])
+    horizon = horizon.replace(microsecond=horizon.microsecond // 1000 * 1000)
+    query = {
+        'user_id': str(current_user['_id']),
+        'project_id': str(project['_id']),
+        'updated_at': {'$lte': horizon},
+    }
+    if request.args.get('video_index') is not None:
+        vi = request.args.get('video_index', type=int)
+        if vi is None:
+            return jsonify({"error": "Invalid video_index"}), 400
+        query['video_index'] = vi
+    since, ts = request.args.get('since'), None
+    if since:
+        try:
+            ts, cvi, csi = _parse_change_cursor(since)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        # (updated_at, video_index, sample_index) > cursor; ties share a bulk write's timestamp
+        query['$or'] = [
+            {'updated_at': {'$gt': ts}},
+            {'updated_at': ts, 'video_index': {'$gt': cvi}},
+            {'updated_at': ts, 'video_index': cvi, 'sample_index': {'$gt': csi}},
+        ]
+
+    with _stage('changes'):
+        docs = list(mongo.db.annotations.find(
+            query, {'_id': 0, 'video_index': 1, 'sample_index': 1, 'version': 1, 'updated_at': 1, 'boxes': 1}
+        ).sort([('updated_at', ASCENDING), ('video_index', ASCENDING), ('sample_index', ASCENDING)])
+            .limit(limit + 1))
+    more = len(docs) > limit
+    docs = docs[:limit]
+
+    if more:
+        last = docs[-1]
+        cursor = _change_cursor(last['updated_at'], last['video_index'], last['sample_index'])
+    elif ts is not None and ts > horizon:
+        cursor = since
+    else:
+        # nothing else is at or before the horizon; the next call starts after it
+        cursor = _change_cursor(horizon, 1 << 30, 1 << 30)
+    return jsonify({
+        'changes': [{
+            'videoIndex': d['video_index'],
+            'sampleIndex': d['sample_index'],
+            'version': int(d.get('version') or 0),
+            'updatedAt': d['updated_at'].isoformat() + 'Z',
+            'boxes': d.get('boxes') or [],
+        } for d in docs],
+        'cursor': cursor,
+        'more': more,
+    })
 
 
 @app.route('/api/projects/<project_id>/annotations', methods=['POST'])
 @token_required
 def save_frame_annotations(current_user, project_id):
-    try:
-        project = mongo.db.projects.find_one({'_id': ObjectId(project_id)})
-    except Exception:
-        project = None
+    project = _cached_project(project_id)
     if not project or project.get('user_id') != str(current_user['_id']):
         return jsonify({"error": "Project not found or unauthorized"}), 404
 
@@ -642,27 +3414,645 @@ def save_frame_annotations(current_user, project_id):
     boxes = request.get_json(silent=True)
     if boxes is None or not isinstance(boxes, list):
         return jsonify({"error": "Body must be a JSON array of boxes"}), 400
+    expected = request.args.get('version', type=int)
 
-    mongo.db.annotations.update_one(
-        {
-            'user_id': str(current_user['_id']),
-            'project_id': str(project['_id']),
-            'video_index': int(video_index),
-            'sample_index': int(sample_index),
-        },
-        {
-            '$set': {
-                'boxes': boxes,
-                'updated_at': datetime.datetime.utcnow(),
+    key = _annotation_key(current_user, project, video_index, sample_index)
+    try:
+        doc = mongo.db.annotations.find_one_and_update(
+            _versioned_filter(key, expected),
+            {
+                '$set': {
+                    'boxes': boxes,
+                    'updated_at': datetime.datetime.utcnow(),
+                },
+                '$inc': {'version': 1},
+                '$setOnInsert': {
+                    'created_at': datetime.datetime.utcnow(),
+                }
             },
-            '$setOnInsert': {
-                'created_at': datetime.datetime.utcnow(),
-            }
-        },
-        upsert=True
-    )
+            projection={'_id': 0, 'version': 1},
+            # a specific non-zero version can only match an existing doc
+            upsert=expected in (None, 0),
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        doc = None
+    if doc is None:
+        return _version_conflict(key)
+
+    _invalidate_stats(key['user_id'], key['project_id'], [video_index])
+    return jsonify({"success": True, "version": int(doc.get('version') or 0)})
+
+
+def _annotation_key(current_user, project, video_index, sample_index):
+    return {
+        'user_id': str(current_user['_id']),
+        'project_id': str(project['_id']),
+        'video_index': int(video_index),
+        'sample_index': int(sample_index),
+    }
+
 
-    return jsonify({"success": True})
+def _versioned_filter(key, expected):
+    """Frame filter, optionally pinned to the version the client last saw.
+
+    Version 0 means "no saved doc yet" and also matches docs written before versions
+    existed; if a newer doc exists, the upsert collides with the unique frame_key index.
+    """
+    if expected is None:
+        return dict(key)
+    return dict(key, version={'$in': [0, None]} if expected == 0 else expected)
+
+
+def _version_conflict(key):
+    current = mongo.db.annotations.find_one(key, {'_id': 0, 'version': 1}) or {}
+    return jsonify({
+        "error": "Annotations were changed by another session",
+        "version": int(current.get('version') or 0),
+    }), 409
+
+
+def _box_patch_pipeline(add, update, remove, now):
+    """Update pipeline applying one box patch to a frame doc atomically.
+
+    Removed ids (and ids being re-added) are filtered out, updated ids get their
+    changed fields merged in, and added boxes are appended. Client values are wrapped
+    in $literal so strings starting with '$' are never read as field paths.
+    """
+    drop = list(remove) + [b['id'] for b in add]
+    if update:
+        merged = {'$switch': {
+            'branches': [
+                {
+                    'case': {'$eq': ['$$b.id', {'$literal': u['id']}]},
+                    'then': {'$mergeObjects': ['$$b', {'$literal': {k: v for k, v in u.items() if k != 'id'}}]},
+                }
+                for u in update
+            ],
+            'default': '$$b',
+        }}
+    else:
+        merged = '$$b'
+    kept = {'$filter': {
+        'input': {'$ifNull': ['$boxes', []]},
+        'as': 'b',
+        'cond': {'$not': [{'$in': ['$$b.id', {'$literal': drop}]}]},
+    }}
+    return [{'$set': {
+        'boxes': {'$concatArrays': [
+            {'$map': {'input': kept, 'as': 'b', 'in': merged}},
+            {'$literal': add},
+        ]},
+        'version': {'$add': [{'$ifNull': ['$version', 0]}, 1]},
+        'updated_at': now,
+        'created_at': {'$ifNull': ['$created_at', now]},
+    }}]
+
+
+@app.route('/api/projects/<project_id>/annotations', methods=['PATCH'])
+@token_required
+def patch_frame_annotations(current_user, project_id):
+    """Apply box-level edits to one frame instead of replacing the whole array.
+
+    Body: {"version": N, "add": [box, ...], "update": [{"id": ..., <changed fields>}],
+    "remove": [id, ...]}. Boxes are addressed by their `id`. With `version`, the patch
+    only applies if the frame is still at that version; otherwise 409 with the current
+    version. Responds with the new version.
+    """
+    project = _cached_project(project_id)
+    if not project or project.get('user_id') != str(current_user['_id']):
+        return jsonify({"error": "Project not found or unauthorized"}), 404
+
+    video_index = request.args.get('video_index', type=int)
+    sample_index = request.args.get('sample_index', type=int)
+    if video_index is None or sample_index is None:
+        return jsonify({"error": "video_index and sample_index are required"}), 400
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Body must be a JSON object with add/update/remove"}), 400
+    add = body.get('add') or []
+    update = body.get('update') or []
+    remove = body.get('remove') or []
+    if not (isinstance(add, list) and isinstance(update, list) and isinstance(remove, list)):
+        return jsonify({"error": "add, update and remove must be lists"}), 400
+    if any(not isinstance(b, dict) or b.get('id') is None for b in add + update):
+        return jsonify({"error": "Every added or updated box needs an id"}), 400
+    if any(isinstance(r, (dict, list)) for r in remove):
+        return jsonify({"error": "remove must be a list of box ids"}), 400
+    expected = body.get('version')
+    if expected is not None and not isinstance(expected, int):
+        return jsonify({"error": "version must be an integer"}), 400
+
+    key = _annotation_key(current_user, project, video_index, sample_index)
+    try:
+        doc = mongo.db.annotations.find_one_and_update(
+            _versioned_filter(key, expected),
+            _box_patch_pipeline(add, update, remove, datetime.datetime.utcnow()),
+            projection={'_id': 0, 'version': 1},
+            upsert=expected in (None, 0),
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        doc = None
+    if doc is None:
+        return _version_conflict(key)
+
+    _invalidate_stats(key['user_id'], key['project_id'], [video_index])
+    return jsonify({"success": True, "version": int(doc.get('version') or 0)})
+
+# -------- Temporal propagation (bulk prebox / interpolation / pre-attribute) --------
+
+_BOX_COORDS = ('left', 'top', 'width', 'height')
+
+
+def _same_object(box, object_id):
+    try:
+        return int(box.get('objectId')) == object_id
+    except (TypeError, ValueError):
+        return False
+
+
+def _new_box_id(seq):
+    # matches the frontend's Date.now() ids; seq keeps ids from one request distinct
+    return int(time.time() * 1000) + seq
+
+
+def _interpolate_track(start_box, end_box, s0, s1):
+    """Linearly interpolate one track's box for every sample strictly between s0 and s1.
+
+    Returns {sample_index: box}; non-coordinate fields come from `start_box`.
+    """
+    samples = np.arange(s0 + 1, s1)
+    if samples.size == 0:
+        return {}
+    a = np.array([float(start_box.get(k) or 0.0) for k in _BOX_COORDS])
+    b = np.array([float(end_box.get(k) or 0.0) for k in _BOX_COORDS])
+    t = (samples - s0) / float(s1 - s0)
+    coords = a + t[:, None] * (b - a)
+    out = {}
+    for si, row in zip(samples.tolist(), coords.tolist()):
+        box = dict(start_box)
+        box.update(zip(_BOX_COORDS, row))
+        out[si] = box
+    return out
+
+
+def _write_frames(key_base, frames, now):
+    """Upsert {sample_index: boxes} for one view with a single unordered bulk_write."""
+    if not frames:
+        return 0
+    ops = [
+        UpdateOne(
+            dict(key_base, sample_index=si),
+            {
+                '$set': {'boxes': boxes, 'updated_at': now},
+                '$inc': {'version': 1},
+                '$setOnInsert': {'created_at': now},
+            },
+            upsert=True
+        )
+        for si, boxes in frames.items()
+    ]
+    mongo.db.annotations.bulk_write(ops, ordered=False)
+    _invalidate_stats(key_base['user_id'], key_base['project_id'], [key_base['video_index']])
+    return len(ops)
+
+
+@app.route('/api/projects/<project_id>/annotations/propagate', methods=['POST'])
+@token_required
+def propagate_annotations(current_user, project_id):
+    """Fill a range of samples of one view server-side, in one request.
+
+    Body: {"mode": ..., "video_index": V, ...}
+      - "interpolate": {"object_id", "start", "end"} – the object's box on keyframes
+        `start` and `end` is linearly interpolated into every sample between them,
+        replacing that object's box there (other boxes are kept).
+      - "copy": {"from", "count"} – like "Load prebox" repeated: samples
+        from+1..from+count get a copy of the boxes on sample `from`.
+      - "attributes": {"from", "start", "end"[, "object_ids"]} – like "Load
+        Pre-attribute" (FR-22) over a range: boxes in start..end take the attributes
+        of the box with the same objectId on sample `from`.
+    """
+    project = _cached_project(project_id)
+    if not project or project.get('user_id') != str(current_user['_id']):
+        return jsonify({"error": "Project not found or unauthorized"}), 404
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Body must be a JSON object"}), 400
+    mode = body.get('mode')
+    try:
+        video_index = int(body.get('video_index'))
+    except (TypeError, ValueError):
+        return jsonify({"error": "video_index is required"}), 400
+
+    info, err = _video_info_for(project, video_index)
+    if err:
+        msg, code = err
+        return jsonify({"error": msg}), code
+    last = info['sampled_count'] - 1
+    max_span = app.config['PROPAGATE_MAX_SAMPLES']
+
+    def sample_arg(name):
+        v = body.get(name)
+        if not isinstance(v, int) or v < 0 or v > last:
+            raise ValueError(f"{name} must be a sample index in 0..{last}")
+        return v
+
+    key_base = {
+        'user_id': str(current_user['_id']),
+        'project_id': str(project['_id']),
+        'video_index': video_index,
+    }
+
+    def load(lo, hi):
+        cursor = mongo.db.annotations.find(
+            dict(key_base, sample_index={'$gte': lo, '$lte': hi}),
+            {'_id': 0, 'sample_index': 1, 'boxes': 1},
+        )
+        return {int(d['sample_index']): d.get('boxes') or [] for d in cursor}
+
+    now = datetime.datetime.utcnow()
+    try:
+        if mode == 'interpolate':
+            start, end = sample_arg('start'), sample_arg('end')
+            try:
+                object_id = int(body.get('object_id'))
+            except (TypeError, ValueError):
+                return jsonify({"error": "object_id is required"}), 400
+            if end - start < 2:
+                return jsonify({"error": "end must be at least start + 2"}), 400
+            if end - start > max_span:
+                return jsonify({"error": f"At most {max_span} samples per request"}), 400
+            existing = load(start, end)
+            keys = []
+            for si in (start, end):
+                matches = [b for b in existing.get(si, []) if isinstance(b, dict) and _same_object(b, object_id)]
+                if len(matches) != 1:
+                    return jsonify({"error": f"Sample {si} must have exactly one box with objectId {object_id}"}), 400
+                keys.append(matches[0])
+            frames = {}
+            for seq, (si, box) in enumerate(_interpolate_track(keys[0], keys[1], start, end).items()):
+                boxes = existing.get(si, [])
+                prior = next((b for b in boxes if isinstance(b, dict) and _same_object(b, object_id)), None)
+                box['id'] = prior['id'] if prior and prior.get('id') is not None else _new_box_id(seq)
+                frames[si] = [b for b in boxes if b is not prior] + [box]
+
+        elif mode == 'copy':
+            src = sample_arg('from')
+            count = body.get('count')
+            if not isinstance(count, int) or count < 1:
+                return jsonify({"error": "count must be a positive integer"}), 400
+            count = min(count, last - src, max_span)
+            source = load(src, src).get(src, [])
+            if not source:
+                return jsonify({"error": f"No annotations on sample {src}"}), 400
+            frames = {si: source for si in range(src + 1, src + count + 1)}
+
+        elif mode == 'attributes':
+            src, start, end = sample_arg('from'), sample_arg('start'), sample_arg('end')
+            if end < start:
+                return jsonify({"error": "end must be >= start"}), 400
+            if end - start + 1 > max_span:
+                return jsonify({"error": f"At most {max_span} samples per request"}), 400
+            only = body.get('object_ids')
+            source = {}
+            for b in load(src, src).get(src, []):
+                if not isinstance(b, dict) or not isinstance(b.get('attributes'), dict):
+                    continue
+                try:
+                    oid = int(b.get('objectId'))
+                except (TypeError, ValueError):
+                    continue
+                if oid and (not isinstance(only, list) or oid in only):
+                    source[oid] = b['attributes']
+            frames = {}
+            for si, boxes in load(start, end).items():
+                if si == src:
+                    continue
+                changed = False
+                out = []
+                for b in boxes:
+                    oid = None
+                    if isinstance(b, dict):
+                        try:
+                            oid = int(b.get('objectId'))
+                        except (TypeError, ValueError):
+                            pass
+                    if oid in source and b.get('attributes') != source[oid]:
+                        b = dict(b, attributes=dict(source[oid]))
+                        changed = True
+                    out.append(b)
+                if changed:
+                    frames[si] = out
+        else:
+            return jsonify({"error": "mode must be interpolate, copy or attributes"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    written = _write_frames(key_base, frames, now)
+    return jsonify({"success": True, "written": written, "samples": sorted(frames)})
+
+
+# -------- Track IDs --------
+#
+# Boxes carry an integer objectId that links one object across samples and views.
+# The `track_key` multikey index on boxes.objectId makes "every frame containing
+# ID n" an index scan, which backs both the per-ID timeline and server-side renames.
+
+def _object_id_arg(value, what):
+    try:
+        oid = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{what} must be a positive integer')
+    if oid < 1 or isinstance(value, bool):
+        raise ValueError(f'{what} must be a positive integer')
+    return oid
+
+
+def _id_forms(oid):
+    # the frontend stores ints, but older saves may hold the string form
+    return [oid, str(oid)]
+
+
+@app.route('/api/projects/<project_id>/tracks/<object_id>', methods=['GET'])
+@token_required
+def get_track(current_user, project_id, object_id):
+    """Timeline of one track ID: every (view, sample, box) occurrence, in order.
+
+    Query: video_index (optional) restricts to one view. Per view, `gaps` lists the
+    [first, last] sample ranges between the track's first and last occurrence where
+    it has no box.
+    """
+    project = _cached_project(project_id)
+    if not project or project.get('user_id') != str(current_user['_id']):
+        return jsonify({"error": "Project not found or unauthorized"}), 404
+    try:
+        oid = _object_id_arg(object_id, 'object_id')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    query = {'user_id': str(current_user['_id']), 'project_id': str(project['_id']),
+             'boxes.objectId': {'$in': _id_forms(oid)}}
+    if request.args.get('video_index') is not None:
+        vi = request.args.get('video_index', type=int)
+        if vi is None or not (0 <= vi < len(project.get('selected_videos') or [])):
+            return jsonify({"error": "Invalid video_index"}), 400
+        query['video_index'] = vi
+
+    with _stage('tracks'):
+        docs = mongo.db.annotations.find(
+            query, {'_id': 0, 'video_index': 1, 'sample_index': 1, 'boxes': 1}
+        ).sort([('video_index', ASCENDING), ('sample_index', ASCENDING)])
+        docs = list(docs)
+
+    names = project.get('selected_videos') or []
+    occurrences, views = [], {}
+    for doc in docs:
+        vi, si = doc['video_index'], doc['sample_index']
+        for box in doc.get('boxes') or []:
+            if isinstance(box, dict) and _same_object(box, oid):
+                occurrences.append({'videoIndex': vi, 'sampleIndex': si, 'box': box})
+        view = views.setdefault(vi, {'videoIndex': vi, 'video': names[vi] if vi < len(names) else None,
+                                     'first': si, 'last': si, 'samples': 0, 'gaps': []})
+        if si > view['last'] + 1:
+            view['gaps'].append([view['last'] + 1, si - 1])
+        view['last'] = si
+        view['samples'] += 1
+    return jsonify({
+        'objectId': oid,
+        'occurrences': occurrences,
+        'views': [views[vi] for vi in sorted(views)],
+    })
+
+
+def _rename_pipeline(mapping, now):
+    """Update pipeline rewriting box objectIds per `mapping` ({old: new}) in one pass."""
+    renamed = {'$switch': {
+        'branches': [
+            {'case': {'$in': ['$$b.objectId', {'$literal': _id_forms(old)}]}, 'then': {'$literal': new}}
+            for old, new in mapping.items()
+        ],
+        'default': '$$b.objectId',
+    }}
+    return [{'$set': {
+        'boxes': {'$map': {
+            'input': {'$ifNull': ['$boxes', []]},
+            'as': 'b',
+            'in': {'$mergeObjects': ['$$b', {'objectId': renamed}]},
+        }},
+        'version': {'$add': [{'$ifNull': ['$version', 0]}, 1]},
+        'updated_at': now,
+    }}]
+
+
+@app.route('/api/projects/<project_id>/tracks/rename', methods=['POST'])
+@token_required
+def rename_tracks(current_user, project_id):
+    """Rename or merge track IDs across the project with one server-side update.
+
+    Body: {"mapping": {"<old id>": <new id>, ...}, "video_index": V (optional)}.
+    Several old IDs mapping to the same new ID merge those tracks. A sample where the
+    result would hold the same ID twice is a conflict: nothing is written and the
+    conflicting samples are returned with 409 unless "force" is true.
+    """
+    project = _cached_project(project_id)
+    if not project or project.get('user_id') != str(current_user['_id']):
+        return jsonify({"error": "Project not found or unauthorized"}), 404
+
+    body = request.get_json(silent=True) or {}
+    raw = body.get('mapping')
+    if not isinstance(raw, dict) or not raw:
+        return jsonify({"error": "mapping must be a non-empty object"}), 400
+    try:
+        mapping = {_object_id_arg(k, 'mapping key'): _object_id_arg(v, 'mapping value') for k, v in raw.items()}
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    mapping = {old: new for old, new in mapping.items() if old != new}
+    if not mapping:
+        return jsonify({"success": True, "matched": 0, "modified": 0})
+
+    user_id, pid = str(current_user['_id']), str(project['_id'])
+    num_views = len(project.get('selected_videos') or [])
+    query = {'user_id': user_id, 'project_id': pid,
+             'boxes.objectId': {'$in': [f for old in mapping for f in _id_forms(old)]}}
+    if body.get('video_index') is not None:
+        vi = body.get('video_index')
+        if not isinstance(vi, int) or not (0 <= vi < num_views):
+            return jsonify({"error": "Invalid video_index"}), 400
+        query['video_index'] = vi
+
+    if not body.get('force'):
+        conflicts = []
+        with _stage('rename_check'):
+            docs = mongo.db.annotations.find(query, {'_id': 0, 'video_index': 1, 'sample_index': 1, 'boxes': 1})
+            for doc in docs:
+                seen = set()
+                for box in doc.get('boxes') or []:
+                    if not isinstance(box, dict):
+                        continue
+                    try:
+                        oid = int(box.get('objectId'))
+                    except (TypeError, ValueError):
+                        continue
+                    oid = mapping.get(oid, oid)
+                    if oid and oid in seen:
+                        conflicts.append({'videoIndex': doc['video_index'],
+                                          'sampleIndex': doc['sample_index'], 'objectId': oid})
+                        break
+                    seen.add(oid)
+        if conflicts:
+            return jsonify({"error": "Rename would give two boxes the same ID in one sample",
+                            "conflicts": conflicts}), 409
+
+    with _stage('rename'):
+        result = mongo.db.annotations.update_many(query, _rename_pipeline(mapping, datetime.datetime.utcnow()))
+    _invalidate_stats(user_id, pid, [query['video_index']] if 'video_index' in query else range(num_views))
+    return jsonify({"success": True, "matched": result.matched_count, "modified": result.modified_count})
+
+
+# -------- Project statistics --------
+#
+# One aggregation over `annotations` per request, restricted to the views whose
+# cached result is missing or stale. Results are cached per view, so a save only
+# costs the next /stats call a rescan of that one view.
+
+_stats_cache = _TTLCache(app.config['LOOKUP_CACHE_SIZE'], app.config['STATS_CACHE_TTL'])
+
+
+def _stats_key(user_id, project_id, video_index):
+    return f'{user_id}:{project_id}:{video_index}'
+
+
+def _invalidate_stats(user_id, project_id, video_indices):
+    for vi in video_indices:
+        _stats_cache.invalidate(_stats_key(user_id, project_id, vi))
+
+
+def _stats_pipeline(user_id, project_id, video_indices):
+    n_boxes = {'$size': {'$ifNull': ['$boxes', []]}}
+    return [
+        {'$match': {'user_id': user_id, 'project_id': project_id,
+                    'video_index': {'$in': list(video_indices)}}},
+        {'$facet': {
+            'frames': [
+                {'$group': {
+                    '_id': '$video_index',
+                    'docs': {'$sum': 1},
+                    'annotated': {'$sum': {'$cond': [{'$gt': [n_boxes, 0]}, 1, 0]}},
+                    'boxes': {'$sum': n_boxes},
+                    'last_edited': {'$max': '$updated_at'},
+                }},
+            ],
+            'classes': [
+                {'$unwind': '$boxes'},
+                {'$group': {'_id': {'v': '$video_index', 'c': '$boxes.className'}, 'n': {'$sum': 1}}},
+            ],
+            'tracks': [
+                {'$unwind': '$boxes'},
+                # objectId 0 (or none) means the box is not assigned to a track yet
+                {'$match': {'boxes.objectId': {'$nin': [None, 0, '0', '']}}},
+                {'$group': {'_id': {'v': '$video_index', 'id': '$boxes.objectId'}, 'n': {'$sum': 1}}},
+            ],
+            'attributes': [
+                {'$unwind': '$boxes'},
+                {'$match': {'boxes.attributes': {'$type': 'object'}}},
+                {'$project': {'v': '$video_index', 'a': {'$objectToArray': '$boxes.attributes'}}},
+                {'$unwind': '$a'},
+                {'$group': {'_id': {'v': '$v', 'k': '$a.k', 'val': '$a.v'}, 'n': {'$sum': 1}}},
+            ],
+        }},
+    ]
+
+
+def _compute_view_stats(user_id, project_id, video_indices):
+    """{video_index: partial stats} for `video_indices`, from one aggregation."""
+    views = {vi: {'docs': 0, 'annotated': 0, 'boxes': 0, 'last_edited': None,
+                  'classes': {}, 'tracks': {}, 'attributes': {}} for vi in video_indices}
+    result = next(mongo.db.annotations.aggregate(_stats_pipeline(user_id, project_id, video_indices)), {})
+    for row in result.get('frames', []):
+        v = views[row['_id']]
+        v.update(docs=row['docs'], annotated=row['annotated'], boxes=row['boxes'],
+                 last_edited=row.get('last_edited'))
+    for row in result.get('classes', []):
+        views[row['_id']['v']]['classes'][str(row['_id'].get('c'))] = row['n']
+    for row in result.get('tracks', []):
+        views[row['_id']['v']]['tracks'][str(row['_id']['id'])] = row['n']
+    for row in result.get('attributes', []):
+        hist = views[row['_id']['v']]['attributes'].setdefault(row['_id']['k'], {})
+        hist[str(row['_id'].get('val'))] = row['n']
+    return views
+
+
+@app.route('/api/projects/<project_id>/stats', methods=['GET'])
+@token_required
+def get_project_stats(current_user, project_id):
+    """Progress and label distribution: per-view coverage, classes, track IDs, attribute values."""
+    project = _cached_project(project_id)
+    if not project or project.get('user_id') != str(current_user['_id']):
+        return jsonify({"error": "Project not found or unauthorized"}), 404
+
+    user_id, pid = str(current_user['_id']), str(project['_id'])
+    names = project.get('selected_videos') or []
+    partial = {}
+    for vi in range(len(names)):
+        cached = _stats_cache.get(_stats_key(user_id, pid, vi))
+        if cached is not None:
+            partial[vi] = cached
+    missing = [vi for vi in range(len(names)) if vi not in partial]
+    if missing:
+        with _stage('stats'):
+            fresh = _compute_view_stats(user_id, pid, missing)
+        for vi, stats in fresh.items():
+            _stats_cache.put(_stats_key(user_id, pid, vi), stats)
+        partial.update(fresh)
+
+    schema = project.get('attributes') or {}
+    classes, tracks = {}, {}
+    attributes = {k: {str(o): 0 for o in opts} for k, opts in schema.items()}
+    views = []
+    for vi, name in enumerate(names):
+        v = partial[vi]
+        info, err = _video_info_for(project, vi)
+        sampled = info['sampled_count'] if not err else None
+        for c, n in v['classes'].items():
+            classes[c] = classes.get(c, 0) + n
+        for t, n in v['tracks'].items():
+            tracks[t] = tracks.get(t, 0) + n
+        for k, hist in v['attributes'].items():
+            if k in attributes:
+                for val, n in hist.items():
+                    attributes[k][val] = attributes[k].get(val, 0) + n
+        views.append({
+            'videoIndex': vi,
+            'video': name,
+            'sampledCount': sampled,
+            'annotatedSamples': v['annotated'],
+            'progress': round(v['annotated'] / float(sampled), 4) if sampled else None,
+            'boxes': v['boxes'],
+            'trackIds': len(v['tracks']),
+            'lastEditedAt': v['last_edited'].isoformat() if v['last_edited'] else None,
+        })
+
+    sampled_total = sum(v['sampledCount'] or 0 for v in views)
+    annotated_total = sum(v['annotatedSamples'] for v in views)
+    edited = [partial[vi]['last_edited'] for vi in partial if partial[vi]['last_edited']]
+    return jsonify({
+        'projectId': pid,
+        'views': views,
+        'totals': {
+            'sampledCount': sampled_total,
+            'annotatedSamples': annotated_total,
+            'progress': round(annotated_total / float(sampled_total), 4) if sampled_total else None,
+            'boxes': sum(v['boxes'] for v in views),
+            'trackIds': len(tracks),
+            'lastEditedAt': max(edited).isoformat() if edited else None,
+        },
+        'classes': classes,
+        'tracks': tracks,
+        'attributes': attributes,
+    })
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=56250, debug=True)
@@ -0,0 +1,560 @@
+"""Load and latency benchmark for the backend.
+
+Generates synthetic multi-view videos with cv2.VideoWriter, replays annotator-like
+request traces against app.py and writes per-endpoint latency percentiles,
+throughput and peak RSS as JSON, so two runs can be compared.
+
+By default the app runs in this process behind Flask's test client, on an in-memory
+Mongo stand-in (mongomock, `pip install mongomock`). --mongo-uri points it at a
+real mongod instead, and --base-url drives an already running server over HTTP,
+e.g. gunicorn in SERVER_MODE=async. That server must be able to read --video-dir.
+
+    python bench.py --out before.json
+    python bench.py --mongo-uri mongodb://localhost:27017/labelmv_bench --out after.json
+    python bench.py --compare before.json after.json
+"""
+import argparse
+import datetime
+import http.client
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import cv2
+import numpy as np
+
+# OpenCV's FFmpeg writer fixes the GOP at 12 frames and ignores
+# VIDEOWRITER_PROP_KEY_INTERVAL, so the GOP sizes on offer are set by the codec.
+_GOP_CODECS = {
+    1: ('MJPG', '.avi'),   # intra-only: every frame is a keyframe
+    12: ('mp4v', '.mp4'),  # MPEG-4 Part 2, keyframe every 12 frames
+}
+
+SCENARIOS = ('scrub', 'seek', 'views', 'autosave', 'bulk')
+
+
+# -------- Synthetic videos --------
+
+def make_video(path, width, height, frames, fps, gop, seed):
+    """Write a moving textured pattern with the frame number burned in."""
+    fourcc, _ = _GOP_CODECS[gop]
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f'cannot write {fourcc} video {path}')
+    rs = np.random.RandomState(seed)
+    # blurred noise compresses like real footage rather than flat colour
+    base = cv2.GaussianBlur(rs.randint(0, 255, (height, width, 3), np.uint8), (15, 15), 0)
+    scale = max(1.0, height / 120.0)
+    try:
+        for i in range(frames):
+            frame = np.roll(base, (i * 2) % width, axis=1)
+            cv2.putText(frame, str(i), (10, int(40 * scale)), cv2.FONT_HERSHEY_SIMPLEX,
+                        scale, (255, 255, 255), max(1, int(2 * scale)))
+            writer.write(frame)
+    finally:
+        writer.release()
+
+
+def make_video_sets(video_dir, resolutions, gops, views, frames, fps, seed):
+    """Return [{'name', 'width', 'height', 'gop', 'videos'}], reusing files already on disk."""
+    os.makedirs(video_dir, exist_ok=True)
+    sets = []
+    for width, height in resolutions:
+        for gop in gops:
+            name = f'{width}x{height}_gop{gop}'
+            ext = _GOP_CODECS[gop][1]
+            videos = []
+            for view in range(views):
+                fname = f'{name}_{frames}f_view{view}{ext}'
+                path = os.path.join(video_dir, fname)
+                if not os.path.isfile(path):
+                    make_video(path, width, height, frames, fps, gop, seed + view)
+                videos.append(fname)
+            sets.append({'name': name, 'width': width, 'height': height, 'gop': gop,
+                         'videos': videos})
+    return sets
+
+
+# -------- Clients --------
+
+class _Result:
+    __slots__ = ('status', 'body', 'headers')
+
+    def __init__(self, status, body, headers):
+        self.status = status
+        self.body = body
+        self.headers = headers
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class LocalClient:
+    """Calls the app in this process through Flask's test client."""
+
+    def __init__(self, flask_app):
+        self._client = flask_app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        resp = self._client.open(path, method=method, data=body, headers=headers or {})
+        return _Result(resp.status_code, resp.get_data(), dict(resp.headers))
+
+
+class HttpClient:
+    """Calls a running server over one keep-alive HTTP connection."""
+
+    def __init__(self, base_url):
+        url = urllib.parse.urlsplit(base_url)
+        self._host, self._port = url.hostname, url.port or 80
+        self._conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        for attempt in (0, 1):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self._host, self._port, timeout=60)
+            try:
+                self._conn.request(method, path, body=body, headers=headers or {})
+                resp = self._conn.getresponse()
+                return _Result(resp.status, resp.read(), dict(resp.getheaders()))
+            except (http.client.HTTPException, ConnectionError):
+                # the server closed an idle keep-alive connection; reconnect once
+                self._conn.close()
+                self._conn = None
+                if attempt:
+                    raise
+
+
+# -------- Measurement --------
+
+def _rss_bytes(pid=None):
+    """Current resident set size of `pid` (default: this process) and its children."""
+    pids = [pid or os.getpid()]
+    try:
+        with open(f'/proc/{pids[0]}/task/{pids[0]}/children') as fh:
+            pids += [int(p) for p in fh.read().split()]
+    except OSError:
+        pass
+    total = 0
+    for p in pids:
+        try:
+            with open(f'/proc/{p}/statm') as fh:
+                total += int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            continue
+    return total or None
+
+
+class Recorder:
+    """Collects latency, status, bytes and RSS samples per endpoint label."""
+
+    def __init__(self, rss_pid=None):
+        self.rss_pid = rss_pid
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def call(self, client, method, label, path, body=None, headers=None, expect=(200,)):
+        t0 = time.perf_counter()
+        res = client.request(method, path, body=body, headers=headers)
+        elapsed = time.perf_counter() - t0
+        rss = _rss_bytes(self.rss_pid)
+        with self._lock:
+            s = self._samples.setdefault(label, {'latency': [], 'status': {}, 'bytes': 0,
+                                                 'rss_peak': 0, 'unexpected': 0})
+            s['latency'].append(elapsed)
+            s['status'][str(res.status)] = s['status'].get(str(res.status), 0) + 1
+            s['bytes'] += len(res.body)
+            if rss:
+                s['rss_peak'] = max(s['rss_peak'], rss)
+            if res.status not in expect:
+                s['unexpected'] += 1
+        return res
+
+    def summary(self, wall):
+        out = {}
+        for label, s in sorted(self._samples.items()):
+            lat = np.array(s['latency']) * 1000.0
+            out[label] = {
+                'count': int(lat.size),
+                'p50_ms': round(float(np.percentile(lat, 50)), 3),
+                'p95_ms': round(float(np.percentile(lat, 95)), 3),
+                'p99_ms': round(float(np.percentile(lat, 99)), 3),
+                'mean_ms': round(float(lat.mean()), 3),
+                'max_ms': round(float(lat.max()), 3),
+                'throughput_rps': round(lat.size / wall, 2) if wall > 0 else None,
+                'bytes': s['bytes'],
+                'status': s['status'],
+                'unexpected_status': s['unexpected'],
+                'rss_peak_mb': round(s['rss_peak'] / 2 ** 20, 1) if s['rss_peak'] else None,
+            }
+        return out
+
+
+# -------- Annotator traces --------
+
+def _json_body(obj):
+    return json.dumps(obj).encode(), {'Content-Type': 'application/json'}
+
+
+def _auth(token, extra=None):
+    headers = {'Authorization': 'Bearer ' + token}
+    headers.update(extra or {})
+    return headers
+
+
+def _boxes(rng, n, sample_index):
+    # same shape as the frontend's boxes: geometry normalized to [0, 1]
+    return [{
+        'id': sample_index * 1000 + k,
+        'objectId': k,
+        'className': 'person' if k % 2 == 0 else 'car',
+        'left': round(rng.uniform(0, 0.7), 4), 'top': round(rng.uniform(0, 0.7), 4),
+        'width': round(rng.uniform(0.03, 0.3), 4), 'height': round(rng.uniform(0.03, 0.3), 4),
+        'attributes': {'Mask': rng.choice(['NA', 'PR'])},
+    } for k in range(n)]
+
+
+class Annotator:
+    """One simulated user: its own client, account and project per video set."""
+
+    def __init__(self, client, recorder, name, seed):
+        self.client = client
+        self.rec = recorder
+        self.rng = random.Random(seed)
+        body, headers = _json_body({'username': name, 'password': 'bench'})
+        client.request('POST', '/api/auth/signup', body=body, headers=headers)
+        res = client.request('POST', '/api/auth/signin', body=body, headers=headers)
+        if res.status != 200:
+            raise RuntimeError(f'sign-in failed for {name}: {res.status} {res.body[:200]!r}')
+        self.token = res.json()['token']
+
+    def create_project(self, video_dir, videos, fps):
+        body, headers = _json_body({
+            'videoDirectory': video_dir, 'selectedVideos': videos, 'fps': fps,
+            'classes': ['person', 'car'], 'attributes': {'Mask': ['NA', 'PR']},
+        })
+        res = self.rec.call(self.client, 'POST', 'POST /api/projects', '/api/projects',
+                            body=body, headers=_auth(self.token, headers))
+        pid = res.json()['projectId']
+        info = self.rec.call(self.client, 'GET', 'GET /video_info',
+                             f'/api/projects/{pid}/video_info?video_index=0',
+                             headers=_auth(self.token)).json()
+        return pid, int(info['sampled_count'])
+
+    def _get(self, label, path, expect=(200,)):
+        return self.rec.call(self.client, 'GET', label, path, headers=_auth(self.token),
+                             expect=expect)
+
+    def _frame(self, pid, view, si):
+        # 503 is the decode pool shedding load, which a client retries
+        return self._get('GET /frame', f'/api/projects/{pid}/frame?video_index={view}'
+                         f'&sample_index={si}', expect=(200, 503))
+
+    def _annotations(self, pid, view, si):
+        return self._get('GET /annotations', f'/api/projects/{pid}/annotations?video_index={view}'
+                         f'&sample_index={si}')
+
+    def _save(self, pid, view, si, boxes):
+        body, headers = _json_body(boxes)
+        return self.rec.call(self.client, 'POST', 'POST /annotations',
+                             f'/api/projects/{pid}/annotations?video_index={view}&sample_index={si}',
+                             body=body, headers=_auth(self.token, headers))
+
+    def scrub(self, pid, samples, views, steps):
+        """Step through one view frame by frame, saving a box now and then."""
+        view = self.rng.randrange(views)
+        start = self.rng.randrange(samples)
+        for k in range(steps):
+            si = (start + k) % samples
+            self._frame(pid, view, si)
+            self._annotations(pid, view, si)
+            if k % 5 == 4:
+                self._save(pid, view, si, _boxes(self.rng, 3, si))
+
+    def seek(self, pid, samples, views, steps):
+        """Jump to random frames of random views, as when clicking on the timeline."""
+        for _ in range(steps):
+            view, si = self.rng.randrange(views), self.rng.randrange(samples)
+            self._frame(pid, view, si)
+            self._annotations(pid, view, si)
+
+    def views(self, pid, samples, views, steps):
+        """Cycle through every view at each sample, one request per view and then batched."""
+        start = self.rng.randrange(samples)
+        for k in range(steps):
+            si = (start + k) % samples
+            if k % 2 == 0:
+                for view in range(views):
+                    self._frame(pid, view, si)
+            else:
+                self._get('GET /frames', f'/api/projects/{pid}/frames?sample_index={si}')
+            self._get('GET /annotations/range', f'/api/projects/{pid}/annotations/range'
+                      f'?start={si}&end={si}')
+
+    def autosave(self, pid, samples, views, steps):
+        """Bursts of saves to one frame while boxes are dragged, then move on."""
+        view = self.rng.randrange(views)
+        for k in range(steps):
+            si = self.rng.randrange(samples)
+            boxes = _boxes(self.rng, 5, si)
+            for _ in range(6):
+                box = self.rng.choice(boxes)
+                box['left'] = min(0.7, max(0.0, box['left'] + self.rng.uniform(-0.01, 0.01)))
+                box['top'] = min(0.7, max(0.0, box['top'] + self.rng.uniform(-0.01, 0.01)))
+                self._save(pid, view, si, boxes)
+
+    def bulk(self, pid, samples, views, boxes_per_frame):
+        """Import annotations for every frame of every view, then export them every way."""
+        payload = {'schema_version': 1, 'project': {}, 'annotations': [
+            {'video_index': v, 'sample_index': si, 'boxes': _boxes(self.rng, boxes_per_frame, si)}
+            for v in range(views) for si in range(samples)
+        ]}
+        body, headers = _json_body(payload)
+        self.rec.call(self.client, 'POST', 'POST /import', f'/api/projects/{pid}/import',
+                      body=body, headers=_auth(self.token, headers))
+        exported = self._get('GET /export', f'/api/projects/{pid}/export')
+        self._get('GET /export?stream=1', f'/api/projects/{pid}/export?stream=1')
+        self._get('GET /export?format=ndjson&gzip=1',
+                  f'/api/projects/{pid}/export?format=ndjson&gzip=1')
+        self.rec.call(self.client, 'POST', 'POST /api/projects/import', '/api/projects/import',
+                      body=exported.body, headers=_auth(self.token, {'Content-Type': 'application/json'}))
+
+
+# -------- Runner --------
+
+def _load_app(args, work_dir):
+    """Import app.py configured for an isolated run and return the module."""
+    os.environ.setdefault('FRAME_STORE_DIR', os.path.join(work_dir, 'frames'))
+    os.environ.setdefault('PROXY_DIR', os.path.join(work_dir, 'proxies'))
+    os.environ.setdefault('SPRITE_DIR', os.path.join(work_dir, 'sprites'))
+    os.environ.setdefault('SECRET_KEY', 'bench')
+    if args.mongo_uri == 'memory':
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit('the in-memory Mongo stand-in needs mongomock: pip install mongomock '
+                     '(or pass --mongo-uri)')
+        os.environ['MONGO_URI'] = 'mongodb://localhost:27017/labelmv_bench'
+        os.environ['ENSURE_INDEXES'] = '0'
+    else:
+        os.environ['MONGO_URI'] = args.mongo_uri
+        os.environ['ENSURE_INDEXES'] = '0'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as backend
+
+    if args.mongo_uri == 'memory':
+        backend.mongo.db = mongomock.MongoClient().labelmv_bench
+    else:
+        db = backend.mongo.db
+        if 'bench' not in db.name:
+            sys.exit(f'refusing to reset database {db.name!r}: use a name containing "bench"')
+        backend.mongo.cx.drop_database(db.name)
+    backend._ensure_indexes()
+    return backend
+
+
+def _reset_caches(backend):
+    backend.frame_cache = backend._FrameCache(backend.app.config['FRAME_CACHE_MAX_BYTES'])
+
+
+def run_scenario(name, annotators, recorder_factory, project_of, args):
+    recorder = recorder_factory()
+    errors = []
+
+    def drive(annotator):
+        annotator.rec = recorder
+        pid, samples = project_of(annotator)
+        try:
+            if name == 'bulk':
+                annotator.bulk(pid, samples, args.views, args.bulk_boxes)
+            else:
+                getattr(annotator, name)(pid, samples, args.views, args.steps)
+        except Exception as e:  # keep the other annotators running; report it
+            errors.append(f'{type(e).__name__}: {e}')
+
+    # bulk import/export is a one-user operation, not a concurrent trace
+    active = annotators[:1] if name == 'bulk' else annotators
+    threads = [threading.Thread(target=drive, args=(a,)) for a in active]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    result = {'wall_s': round(wall, 3), 'users': len(active), 'errors': errors,
+              'endpoints': recorder.summary(wall)}
+    total = sum(e['count'] for e in result['endpoints'].values())
+    result['throughput_rps'] = round(total / wall, 2) if wall > 0 else None
+    return result
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    work_dir = tempfile.mkdtemp(prefix='labelmv-bench-')
+    video_dir = os.path.abspath(args.video_dir or os.path.join(work_dir, 'videos'))
+    sets = make_video_sets(video_dir, args.resolutions, args.gops, args.views,
+                           args.frames, args.video_fps, args.seed)
+
+    backend = None
+    if args.base_url:
+        def make_client():
+            return HttpClient(args.base_url)
+        rss_pid = args.server_pid
+    else:
+        backend = _load_app(args, work_dir)
+
+        def make_client():
+            return LocalClient(backend.app)
+        rss_pid = None
+
+    run_id = f'{int(time.time())}-{os.getpid()}'
+    setup = Recorder(rss_pid)
+    annotators = []
+    for i in range(args.users):
+        a = Annotator(make_client(), setup, f'bench-{run_id}-{i}', args.seed + i)
+        annotators.append(a)
+
+    report = {
+        'schema_version': 1,
+        'started_at': datetime.datetime.utcnow().isoformat() + 'Z',
+        'git_revision': _git_revision(),
+        'host': {'python': platform.python_version(), 'platform': platform.platform(),
+                 'cpus': os.cpu_count(), 'opencv': cv2.__version__},
+        'config': {
+            'target': args.base_url or 'in-process',
+            'mongo': args.mongo_uri if not args.base_url else 'server',
+            'users': args.users, 'steps': args.steps, 'views': args.views,
+            'frames': args.frames, 'video_fps': args.video_fps, 'project_fps': args.fps,
+            'bulk_boxes': args.bulk_boxes, 'seed': args.seed, 'warm': args.warm,
+            'scenarios': args.scenarios,
+        },
+        'video_sets': {},
+    }
+
+    for vs in sets:
+        projects = {}
+        for a in annotators:
+            a.rec = setup
+            projects[id(a)] = a.create_project(video_dir, vs['videos'], args.fps)
+        scenarios = {}
+        for name in args.scenarios:
+            if backend is not None and not args.warm:
+                _reset_caches(backend)
+            print(f'[{vs["name"]}] {name} ...', file=sys.stderr, flush=True)
+            scenarios[name] = run_scenario(name, annotators, lambda: Recorder(rss_pid),
+                                           lambda a: projects[id(a)], args)
+            if backend is not None:
+                scenarios[name]['frame_cache'] = backend.frame_cache.stats()
+        report['video_sets'][vs['name']] = {
+            'width': vs['width'], 'height': vs['height'], 'gop': vs['gop'],
+            'samples': next(iter(projects.values()))[1], 'scenarios': scenarios,
+        }
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    report['process'] = {'max_rss_mb': round(usage.ru_maxrss / 1024.0, 1)}
+    report['setup'] = setup.summary(1.0)
+    return report
+
+
+# -------- Comparing runs --------
+
+def compare(base_path, new_path, threshold):
+    """Print p50/p95/p99 changes per endpoint; return the number of regressions."""
+    with open(base_path) as fh:
+        base = json.load(fh)
+    with open(new_path) as fh:
+        new = json.load(fh)
+    regressions = 0
+    for set_name, vs in new['video_sets'].items():
+        base_vs = base['video_sets'].get(set_name)
+        if base_vs is None:
+            continue
+        for scen, result in vs['scenarios'].items():
+            base_eps = (base_vs['scenarios'].get(scen) or {}).get('endpoints', {})
+            for label, stats in result['endpoints'].items():
+                old = base_eps.get(label)
+                if not old:
+                    continue
+                cells = []
+                for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                    change = (stats[key] - old[key]) / old[key] if old[key] else 0.0
+                    flag = ''
+                    if change > threshold:
+                        flag = ' !'
+                        regressions += 1
+                    cells.append(f'{key[:3]} {old[key]:.1f}->{stats[key]:.1f}ms ({change:+.0%}){flag}')
+                print(f'{set_name:>18} {scen:<9} {label:<34} ' + '  '.join(cells))
+    return regressions
+
+
+def _resolution(text):
+    w, _, h = text.lower().partition('x')
+    return int(w), int(h)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    p.add_argument('--out', help='write the JSON report here (default: stdout)')
+    p.add_argument('--mongo-uri', default='memory',
+                   help="'memory' (mongomock) or a mongodb:// URI whose database name contains 'bench'")
+    p.add_argument('--base-url', help='drive a running server instead of an in-process app')
+    p.add_argument('--server-pid', type=int, help='with --base-url: sample RSS of this process tree')
+    p.add_argument('--video-dir', help='where to write (and reuse) the synthetic videos')
+    p.add_argument('--resolutions', default='640x360,1280x720',
+                   type=lambda s: [_resolution(r) for r in s.split(',')])
+    p.add_argument('--gops', default='12,1', type=lambda s: [int(g) for g in s.split(',')],
+                   help=f'GOP sizes, from {sorted(_GOP_CODECS)}')
+    p.add_argument('--views', type=int, default=3)
+    p.add_argument('--frames', type=int, default=300)
+    p.add_argument('--video-fps', type=int, default=30)
+    p.add_argument('--fps', type=int, default=5, help='project sampling fps')
+    p.add_argument('--users', type=int, default=4, help='concurrent annotators')
+    p.add_argument('--steps', type=int, default=40, help='trace length per annotator')
+    p.add_argument('--bulk-boxes', type=int, default=20, help='boxes per frame in the bulk import')
+    p.add_argument('--scenarios', default=','.join(SCENARIOS),
+                   type=lambda s: [x for x in s.split(',') if x])
+    p.add_argument('--warm', action='store_true', help='keep frame caches between scenarios')
+    p.add_argument('--seed', type=int, default=1)
+    p.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'),
+                   help='compare two reports instead of running')
+    p.add_argument('--threshold', type=float, default=0.2,
+                   help='with --compare: relative slowdown reported as a regression')
+    args = p.parse_args(argv)
+
+    if args.compare:
+        return 1 if compare(args.compare[0], args.compare[1], args.threshold) else 0
+
+    bad = [g for g in args.gops if g not in _GOP_CODECS]
+    if bad:
+        p.error(f'unsupported GOP size(s) {bad}: OpenCV can write {sorted(_GOP_CODECS)}')
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        p.error(f'unknown scenario(s) {unknown}; choose from {", ".join(SCENARIOS)}')
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as fh:
+            fh.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""Frame decode/encode helpers shared by the API workers and the decode process pool.
+
+Kept free of Flask and Mongo imports so spawned decode processes start quickly and
+never open database connections of their own.
+"""
+import bisect
+import os
+import time
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+import cv2
+
+
+def seek_read(cap, next_frame, frame_num, keyframes, max_forward_grab, timings=None):
+    """Decode `frame_num` from `cap`, whose decoder is positioned at `next_frame`.
+
+    Reads forward through small gaps instead of seeking. With a sorted `keyframes`
+    list, a keyframe between the current position and the target means a seek
+    decodes less than reading through, so we seek. `next_frame` of None means the
+    position is unknown. Returns (ok, frame, new_next_frame). If `timings` is a dict,
+    the seconds spent positioning and decoding are stored under 'seek' and 'decode'.
+    """
+    t0 = time.perf_counter() if timings is not None else 0.0
+    gap = None if next_frame is None else frame_num - next_frame
+    if gap is not None and gap > 0 and keyframes:
+        k = bisect.bisect_right(keyframes, frame_num) - 1
+        if k >= 0 and keyframes[k] > next_frame:
+            gap = None
+    if gap is None or gap < 0 or gap > max_forward_grab:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+    else:
+        for _ in range(gap):
+            if not cap.grab():
+                return False, None, None
+    if timings is not None:
+        t1 = time.perf_counter()
+        timings['seek'] = t1 - t0
+    ok, frame = cap.read()
+    if timings is not None:
+        timings['decode'] = time.perf_counter() - t1
+    if not ok or frame is None:
+        return False, None, None
+    return True, frame, frame_num + 1
+
+
+def render_frame(frame, spec):
+    """Apply crop and resize from a render spec and encode. Returns bytes or None.
+
+    `spec` is (extension, width, height, quality, crop); see app._DEFAULT_ENCODE.
+    """
+    ext, width, height, quality, crop = spec
+    if crop is not None:
+        fh, fw = frame.shape[:2]
+        x0 = min(int(round(crop[0] * fw)), fw - 1)
+        y0 = min(int(round(crop[1] * fh)), fh - 1)
+        x1 = max(x0 + 1, min(int(round((crop[0] + crop[2]) * fw)), fw))
+        y1 = max(y0 + 1, min(int(round((crop[1] + crop[3]) * fh)), fh))
+        frame = frame[y0:y1, x0:x1]
+    if width or height:
+        fh, fw = frame.shape[:2]
+        if not width:
+            width = max(1, int(round(fw * height / float(fh))))
+        elif not height:
+            height = max(1, int(round(fh * width / float(fw))))
+        if (width, height) != (fw, fh):
+            # area averaging for the usual downscale; it is blurry for upscaling
+            interp = cv2.INTER_AREA if width * height < fw * fh else cv2.INTER_LINEAR
+            frame = cv2.resize(frame, (width, height), interpolation=interp)
+
+    params = []
+    if quality and ext == '.jpg':
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    elif quality and ext == '.webp':
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+    elif ext == '.png':
+        params = [cv2.IMWRITE_PNG_COMPRESSION, 3]
+    ok, buf = cv2.imencode(ext, frame, params)
+    return buf.tobytes() if ok else None
+
+
+# -------- Decode process side --------
+#
+# Each decode process keeps a few captures open, keyed by path, with their decoder
+# position, so consecutive samples of one video still read forward.
+
+_MAX_CAPTURES = 4
+_captures = OrderedDict()
+
+
+def _capture_for(path, mtime):
+    entry = _captures.get(path)
+    if entry is not None and entry['mtime'] != mtime:
+        entry['cap'].release()
+        del _captures[path]
+        entry = None
+    if entry is None:
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            cap.release()
+            return None
+        entry = {'cap': cap, 'mtime': mtime, 'next_frame': 0}
+        _captures[path] = entry
+        while len(_captures) > _MAX_CAPTURES:
+            _, old = _captures.popitem(last=False)
+            old['cap'].release()
+    _captures.move_to_end(path)
+    return entry
+
+
+def decode_to_shm(video_path, mtime, frame_num, keyframes, spec, deadline, max_forward_grab):
+    """Decode and encode one frame inside a decode process.
+
+    `keyframes` only needs the last keyframe at or before `frame_num` (see
+    seek_read), so callers send that one rather than the whole list.
+
+    Returns ('ok', shm_name, size, timings) with the encoded bytes left in a shared
+    memory block the caller must unlink and the seek/decode/encode seconds,
+    ('expired',) if `deadline` (time.time()) passed while the job was queued, or
+    ('error', message).
+    """
+    if time.time() > deadline:
+        return ('expired',)
+    entry = _capture_for(video_path, mtime)
+    if entry is None:
+        return ('error', 'Failed to open video')
+    timings = {}
+    ok, frame, entry['next_frame'] = seek_read(
+        entry['cap'], entry['next_frame'], frame_num, keyframes, max_forward_grab, timings)
+    if not ok:
+        return ('error', 'Failed to read frame')
+    t0 = time.perf_counter()
+    data = render_frame(frame, spec)
+    timings['encode'] = time.perf_counter() - t0
+    if data is None:
+        return ('error', 'Failed to encode frame')
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    try:
+        shm.buf[:len(data)] = data
+        name = shm.name
+    finally:
+        shm.close()
+    return ('ok', name, len(data), timings)
+
+
+def take_shm(name, size):
+    """Copy bytes out of a block made by decode_to_shm and free it."""
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(shm.buf[:size])
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def discard_result(result):
+    """Free the shared memory of a result nobody is going to read."""
+    if result and result[0] == 'ok':
+        try:
+            take_shm(result[1], result[2])
+        except (FileNotFoundError, OSError):
+            pass
+
+
+def worker_init():
+    # OpenCV would otherwise start a thread per core in every decode process
+    cv2.setNumThreads(int(os.environ.get('DECODE_THREADS_PER_WORKER', '1')))
+
+
+def extract_frames(video_path, frame_nums, out_dir, quality):
+    """Decode `video_path` once, front to back, writing the wanted frames as JPEGs.
+
+    Frames are written to `out_dir/<frame_num:06d>.jpg` by write-then-rename, so any
+    .jpg visible there is complete. Frames the decoder never reaches are skipped.
+    Returns the number of frames written.
+    """
+    wanted = set(frame_nums)
+    last = max(wanted) if wanted else -1
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        cap.release()
+        raise RuntimeError(f'Failed to open video {video_path}')
+    written = 0
+    try:
+        for frame_num in range(last + 1):
+            # grab() alone skips the colour conversion for frames nobody wants
+            if not cap.grab():
+                break
+            if frame_num not in wanted:
+                continue
+            ok, frame = cap.retrieve()
+            if not ok or frame is None:
+                continue
+            ok, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                continue
+            path = os.path.join(out_dir, f'{frame_num:06d}.jpg')
+            with open(path + '.part', 'wb') as fh:
+                fh.write(buf.tobytes())
+            os.replace(path + '.part', path)
+            written += 1
+    finally:
+        cap.release()
+    return written
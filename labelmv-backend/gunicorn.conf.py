@@ -0,0 +1,18 @@
+"""Gunicorn settings, read from the same environment variables as the app.
+
+SERVER_MODE=sync (default) runs WEB_CONCURRENCY sync workers, one request each.
+SERVER_MODE=async runs the same app under gevent workers, each serving up to
+WORKER_CONNECTIONS requests concurrently; see _ASYNC_MODE in app.py.
+"""
+import os
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '56250')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '3'))
+# app.py divides host-wide thread budgets (e.g. EXTRACT_WORKERS) by this; workers inherit it
+os.environ['WEB_CONCURRENCY'] = str(workers)
+# a sync worker cannot heartbeat mid-request; dataset exports run as background jobs for this reason
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+
+if os.environ.get('SERVER_MODE', 'sync') == 'async':
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('WORKER_CONNECTIONS', '500'))
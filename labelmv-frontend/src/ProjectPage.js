@@ -127,7 +127,9 @@ const ProjectPage = () => {
   // Step 1: Fetch videos from fixed directory
   const handleSetPathClick = async () => {
     try {
-      const res = await fetch(`/videos?directory=${encodeURIComponent(DEFAULT_VIDEO_DIR)}`);
+      const res = await fetch(`/videos?directory=${encodeURIComponent(DEFAULT_VIDEO_DIR)}`, {
+        headers: { 'Authorization': `Bearer ${authToken}` }
+      });
       if (!res.ok) {
         const txt = await res.text();
         throw new Error(`Failed to fetch videos: ${res.status} ${txt}`);